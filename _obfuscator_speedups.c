@@ -0,0 +1,265 @@
+/*
+ * 数据加扰模块的可选 C 加速实现
+ *
+ * 与 obfuscator.py 中的纯 Python 实现产生逐字节相同的结果：
+ *   encode: 对已组装好的数据包做 XOR + 4字节块反转（单次遍历）
+ *   decode: 4字节块反转恢复 + XOR（单次遍历）
+ *   xor_stream: 从密钥流指定位置开始的连续 XOR（xorstream/stream 编解码器）
+ *
+ * 所有函数都在调用方提供的可写缓冲区上原地操作，处理大缓冲区时释放 GIL。
+ *
+ * 构建: python3 build_speedups.py
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <string.h>
+
+/* 超过该长度时释放 GIL */
+#define RELEASE_GIL_THRESHOLD 4096
+
+#if defined(_MSC_VER)
+#include <stdlib.h>
+#define BSWAP32(x) _byteswap_ulong(x)
+#else
+#define BSWAP32(x) __builtin_bswap32(x)
+#endif
+
+/*
+ * XOR 与块反转
+ *
+ * 明文位置 j 对应的密钥字节为 key_stream[(offset + j) % key_len]；
+ * prefixed 非零时（FRAME_V2）明文位置 0 为偏移字节，对应 key_stream[0]，
+ * 其后的位置依次从 key_stream[offset] 开始。
+ *
+ * extended_key 为密钥流后接其前4字节（长度 key_len + 4），
+ * 使每个4字节块的密钥可以连续读取而无需处理回绕。
+ */
+static void
+transform(unsigned char *buf, Py_ssize_t len,
+          const unsigned char *extended_key, Py_ssize_t key_len,
+          Py_ssize_t offset, int prefixed, int decode)
+{
+    Py_ssize_t aligned = len - len % 4;
+    /* 块起始位置 i 对应的密钥流位置为 key_pos（块0在 prefixed 时单独处理首字节） */
+    Py_ssize_t key_pos = (offset + key_len - (prefixed ? 1 : 0)) % key_len;
+    Py_ssize_t i, k, n;
+    uint32_t word, key;
+    unsigned char key_bytes[4], tmp[4];
+
+    for (i = 0; i < aligned; i += 4) {
+        memcpy(&key, extended_key + key_pos, 4);
+        if (prefixed && i == 0) {
+            /* 首字节使用 key_stream[0]，其余3字节从 key_stream[offset] 开始 */
+            memcpy(key_bytes, extended_key + key_pos, 4);
+            key_bytes[0] = extended_key[0];
+            memcpy(&key, key_bytes, 4);
+        }
+        memcpy(&word, buf + i, 4);
+        word = decode ? BSWAP32(word) ^ key : BSWAP32(word ^ key);
+        memcpy(buf + i, &word, 4);
+
+        key_pos += 4;
+        if (key_pos >= key_len) {
+            key_pos -= key_len;
+        }
+    }
+
+    /* 末尾不足4字节的块 */
+    n = len - aligned;
+    if (n > 0) {
+        for (k = 0; k < n; k++) {
+            key_bytes[k] = (prefixed && aligned + k == 0)
+                ? extended_key[0]
+                : extended_key[(key_pos + k) % key_len];
+        }
+        if (decode) {
+            for (k = 0; k < n; k++) {
+                tmp[k] = buf[aligned + n - 1 - k];
+            }
+            for (k = 0; k < n; k++) {
+                buf[aligned + k] = tmp[k] ^ key_bytes[k];
+            }
+        }
+        else {
+            for (k = 0; k < n; k++) {
+                tmp[k] = buf[aligned + k] ^ key_bytes[k];
+            }
+            for (k = 0; k < n; k++) {
+                buf[aligned + k] = tmp[n - 1 - k];
+            }
+        }
+    }
+}
+
+static int
+get_key_stream(PyObject *obj, Py_buffer *view)
+{
+    if (PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) < 0) {
+        return -1;
+    }
+    if (view->len <= 0) {
+        PyBuffer_Release(view);
+        PyErr_SetString(PyExc_ValueError, "key_stream must not be empty");
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject *
+run_transform(PyObject *args, int decode)
+{
+    PyObject *buffer_obj, *key_obj;
+    Py_ssize_t offset;
+    int prefixed;
+    Py_buffer buffer, key;
+    unsigned char *extended_key;
+    Py_ssize_t i;
+
+    if (!PyArg_ParseTuple(args, "OOnp", &buffer_obj, &key_obj, &offset, &prefixed)) {
+        return NULL;
+    }
+    if (offset < 0) {
+        PyErr_SetString(PyExc_ValueError, "offset must be non-negative");
+        return NULL;
+    }
+    if (PyObject_GetBuffer(buffer_obj, &buffer, PyBUF_WRITABLE) < 0) {
+        return NULL;
+    }
+    if (get_key_stream(key_obj, &key) < 0) {
+        PyBuffer_Release(&buffer);
+        return NULL;
+    }
+
+    extended_key = PyMem_Malloc(key.len + 4);
+    if (extended_key == NULL) {
+        PyBuffer_Release(&key);
+        PyBuffer_Release(&buffer);
+        return PyErr_NoMemory();
+    }
+    for (i = 0; i < key.len + 4; i++) {
+        extended_key[i] = ((const unsigned char *)key.buf)[i % key.len];
+    }
+
+    if (buffer.len >= RELEASE_GIL_THRESHOLD) {
+        Py_BEGIN_ALLOW_THREADS
+        transform(buffer.buf, buffer.len, extended_key, key.len, offset, prefixed, decode);
+        Py_END_ALLOW_THREADS
+    }
+    else {
+        transform(buffer.buf, buffer.len, extended_key, key.len, offset, prefixed, decode);
+    }
+
+    PyMem_Free(extended_key);
+    PyBuffer_Release(&key);
+    PyBuffer_Release(&buffer);
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+speedups_encode(PyObject *self, PyObject *args)
+{
+    return run_transform(args, 0);
+}
+
+static PyObject *
+speedups_decode(PyObject *self, PyObject *args)
+{
+    return run_transform(args, 1);
+}
+
+static void
+xor_stream(unsigned char *buf, Py_ssize_t len,
+           const unsigned char *key_stream, Py_ssize_t key_len,
+           Py_ssize_t position)
+{
+    Py_ssize_t key_pos = position % key_len;
+    Py_ssize_t i = 0, j, segment;
+
+    /* 按密钥流回绕点分段，段内连续异或便于编译器向量化 */
+    while (i < len) {
+        segment = key_len - key_pos;
+        if (segment > len - i) {
+            segment = len - i;
+        }
+        for (j = 0; j < segment; j++) {
+            buf[i + j] ^= key_stream[key_pos + j];
+        }
+        i += segment;
+        key_pos = 0;
+    }
+}
+
+static PyObject *
+speedups_xor_stream(PyObject *self, PyObject *args)
+{
+    PyObject *buffer_obj, *key_obj;
+    Py_ssize_t position;
+    Py_buffer buffer, key;
+
+    if (!PyArg_ParseTuple(args, "OOn", &buffer_obj, &key_obj, &position)) {
+        return NULL;
+    }
+    if (position < 0) {
+        PyErr_SetString(PyExc_ValueError, "position must be non-negative");
+        return NULL;
+    }
+    if (PyObject_GetBuffer(buffer_obj, &buffer, PyBUF_WRITABLE) < 0) {
+        return NULL;
+    }
+    if (get_key_stream(key_obj, &key) < 0) {
+        PyBuffer_Release(&buffer);
+        return NULL;
+    }
+
+    if (buffer.len >= RELEASE_GIL_THRESHOLD) {
+        Py_BEGIN_ALLOW_THREADS
+        xor_stream(buffer.buf, buffer.len, key.buf, key.len, position);
+        Py_END_ALLOW_THREADS
+    }
+    else {
+        xor_stream(buffer.buf, buffer.len, key.buf, key.len, position);
+    }
+
+    PyBuffer_Release(&key);
+    PyBuffer_Release(&buffer);
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef speedups_methods[] = {
+    {"encode", speedups_encode, METH_VARARGS,
+     "encode(buffer, key_stream, offset, prefixed)\n\n"
+     "In place: XOR the assembled packet with the key stream, then reverse each 4-byte block."},
+    {"decode", speedups_decode, METH_VARARGS,
+     "decode(buffer, key_stream, offset, prefixed)\n\n"
+     "In place: undo the 4-byte block reversal, then XOR with the key stream."},
+    {"xor_stream", speedups_xor_stream, METH_VARARGS,
+     "xor_stream(buffer, key_stream, position)\n\n"
+     "In place: XOR with the key stream starting at the given position."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT,
+    "_obfuscator_speedups",
+    "Optional C accelerator for obfuscator.py",
+    -1,
+    speedups_methods
+};
+
+PyMODINIT_FUNC
+PyInit__obfuscator_speedups(void)
+{
+    PyObject *module = PyModule_Create(&speedups_module);
+    if (module == NULL) {
+        return NULL;
+    }
+    /* 大缓冲区处理期间释放 GIL，可安全地在线程池中并行调用 */
+    if (PyModule_AddIntConstant(module, "RELEASES_GIL", 1) < 0
+        || PyModule_AddIntConstant(module, "RELEASE_GIL_THRESHOLD", RELEASE_GIL_THRESHOLD) < 0) {
+        Py_DECREF(module);
+        return NULL;
+    }
+    return module;
+}
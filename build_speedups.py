@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+构建数据加扰模块的可选 C 加速扩展（_obfuscator_speedups）
+生成的扩展模块放在本目录，obfuscator.py 导入时自动检测，不存在时使用纯 Python 实现
+
+Requirements:
+  pip install setuptools
+  C 编译器（Linux: gcc/clang，Windows: MSVC Build Tools）
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+
+
+def build(verbose=False):
+    """
+    原地编译扩展模块
+    
+    Args:
+        verbose: 是否显示编译器输出
+    
+    Returns:
+        bool: 成功返回 True
+    """
+    try:
+        from setuptools import Distribution, Extension
+    except ImportError:
+        print('✗ Error: setuptools not installed (pip install setuptools)')
+        return False
+    
+    script_dir = Path(__file__).parent
+    source = script_dir / '_obfuscator_speedups.c'
+    if not source.exists():
+        print(f'✗ Error: {source.name} not found')
+        return False
+    
+    extension = Extension(
+        '_obfuscator_speedups',
+        sources=[str(source.relative_to(script_dir))],
+        extra_compile_args=['/O2'] if os.name == 'nt' else ['-O3'],
+    )
+    
+    distribution = Distribution({'name': '_obfuscator_speedups', 'ext_modules': [extension]})
+    distribution.script_args = ([] if verbose else ['--quiet']) + ['build_ext', '--inplace']
+    
+    cwd = os.getcwd()
+    try:
+        os.chdir(script_dir)
+        distribution.parse_command_line()
+        distribution.run_commands()
+    except Exception as e:
+        print(f'✗ Build failed: {e}')
+        return False
+    finally:
+        os.chdir(cwd)
+    
+    print('✓ Built _obfuscator_speedups')
+    return True
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Build the optional C accelerator for obfuscator.py')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                       help='Show compiler output')
+    
+    args = parser.parse_args()
+    
+    sys.exit(0 if build(args.verbose) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+指标模块
+计数器、仪表与固定桶直方图，以 Prometheus 文本格式通过本地 HTTP 或 Unix 套接字暴露
+
+热路径上只做属性自增：调用方在连接建立时取得指标对象并持有引用，不在每帧查表或格式化字符串。
+"""
+
+import asyncio
+import logging
+import signal
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+# 指标名前缀
+CFG_METRICS_PREFIX = 'wssp'
+
+# 时长直方图的默认桶上界（秒）
+DEFAULT_DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# 阶段耗时直方图的桶：1µs 到约 67s 的对数线性桶（每倍程 4 个，相对误差约 19%），类似 HDR 直方图
+LATENCY_BUCKETS = tuple(1e-6 * 2 ** (i / 4) for i in range(4 * 26 + 1))
+
+# 阶段耗时周期摘要的默认间隔（秒）
+CFG_STAGE_REPORT_INTERVAL = 60
+
+# 中继热路径的阶段（StageClock.lap 的参数）
+STAGE_READ_WAIT = 0  # 等待本地/后端 TCP 数据
+STAGE_OBFUSCATE = 1  # 加扰
+STAGE_WS_SEND = 2  # WebSocket 发送
+STAGE_RECV_WAIT = 3  # 等待 WebSocket 消息
+STAGE_DEOBFUSCATE = 4  # 去加扰
+STAGE_DRAIN = 5  # 写入本地/后端 TCP 并等待 drain
+RELAY_STAGES = ('read_wait', 'obfuscate', 'ws_send', 'recv_wait', 'deobfuscate', 'drain')
+
+# 抓取请求头的读取超时（秒）与大小上限
+CFG_SCRAPE_TIMEOUT = 5
+CFG_SCRAPE_MAX_HEADER = 8 * 1024
+
+UNIX_PREFIX = 'unix:'
+
+logger = logging.getLogger('wss-plugin-metrics')
+
+
+class Counter:
+    """单调递增计数器（热路径上直接对 value 做加法）"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge(Counter):
+    """可增可减的仪表"""
+
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """固定桶直方图：observe 只做一次二分查找和两次加法，不分配内存"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple = DEFAULT_DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, q: float, counts: Optional[list] = None) -> float:
+        """
+        估算分位数（返回所在桶的上界，落在 +Inf 桶时返回最大桶上界）
+
+        Args:
+            q: 分位（0~1）
+            counts: 各桶计数（默认为累计值，传入差值可计算某段时间内的分位数）
+        """
+        counts = self.counts if counts is None else counts
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= rank:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+
+def _format_labels(labels: tuple, extra: str = '') -> str:
+    """格式化标签为 {k="v",...}"""
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value) -> str:
+    """转义标签值"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    """格式化样本值（整数不带小数点）"""
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+
+    指标按 (名称, 标签) 登记，重复获取返回同一对象；另可登记采集函数，
+    在抓取时读取池空闲数等已有状态，避免在热路径上同步维护。
+    """
+
+    def __init__(self, prefix: str = CFG_METRICS_PREFIX):
+        self.prefix = prefix
+        self._families = {}  # 名称 -> [类型, 说明, {标签元组: 指标}]
+        self._collectors = []
+
+    def _get(self, kind: str, name: str, help_text: str, labels: dict, factory: Callable):
+        """取得或创建指标对象"""
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = [kind, help_text, {}]
+        elif family[0] != kind:
+            raise ValueError(f'Metric {name} already registered as {family[0]}')
+        key = tuple(sorted(labels.items()))
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = factory()
+        return metric
+
+    def counter(self, name: str, help_text: str, **labels) -> Counter:
+        """取得计数器"""
+        return self._get('counter', name, help_text, labels, Counter)
+
+    def gauge(self, name: str, help_text: str, **labels) -> Gauge:
+        """取得仪表"""
+        return self._get('gauge', name, help_text, labels, Gauge)
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = DEFAULT_DURATION_BUCKETS,
+                  **labels) -> Histogram:
+        """取得直方图（同名直方图的桶以首次登记为准）"""
+        return self._get('histogram', name, help_text, labels, lambda: Histogram(buckets))
+
+    def count_error(self, stage: str, error: BaseException):
+        """按阶段和异常类型计数错误（仅在出错时调用，不在热路径上）"""
+        self.counter('errors_total', 'Errors by stage and exception type',
+                     stage=stage, type=type(error).__name__).inc()
+
+    def add_collector(self, collect: Callable[[], Iterable[tuple]]):
+        """
+        登记采集函数，抓取时调用
+
+        Args:
+            collect: 返回 (名称, 类型, 说明, 值, 标签字典) 序列的函数
+        """
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式（0.0.4）"""
+        families = {name: [kind, help_text, dict(metrics)]
+                    for name, (kind, help_text, metrics) in self._families.items()}
+        for collect in self._collectors:
+            for name, kind, help_text, value, labels in collect():
+                family = families.setdefault(name, [kind, help_text, {}])
+                metric = Gauge() if kind == 'gauge' else Counter()
+                metric.value = value
+                family[2][tuple(sorted(labels.items()))] = metric
+
+        lines = []
+        for name in sorted(families):
+            kind, help_text, metrics = families[name]
+            full_name = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            for labels, metric in sorted(metrics.items()):
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float('inf'),), metric.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(float(bound))
+                        bucket_labels = _format_labels(labels, 'le="' + le + '"')
+                        lines.append(f'{full_name}_bucket{bucket_labels} {cumulative}')
+                    lines.append(f'{full_name}_sum{_format_labels(labels)} {_format_value(metric.sum)}')
+                    lines.append(f'{full_name}_count{_format_labels(labels)} {metric.count}')
+                else:
+                    lines.append(f'{full_name}{_format_labels(labels)} {_format_value(metric.value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class StageClock:
+    """单个连接方向的阶段计时器：start 记下起点，lap 把距上次的耗时计入对应阶段"""
+
+    __slots__ = ('histograms', 'last')
+
+    def __init__(self, histograms: list):
+        self.histograms = histograms
+        self.last = 0.0
+
+    def start(self):
+        self.last = time.perf_counter()
+
+    def lap(self, stage: int):
+        now = time.perf_counter()
+        self.histograms[stage].observe(now - self.last)
+        self.last = now
+
+
+class StageTimings:
+    """
+    中继热路径各阶段的耗时直方图（opt-in）
+
+    各阶段直方图登记为 stage_seconds{stage=...}，同时可输出文本摘要：
+    周期摘要只统计上次报告以来的增量，信号触发的摘要统计启动以来的累计值。
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.histograms = [
+            registry.histogram('stage_seconds', 'Relay hot-path stage duration', LATENCY_BUCKETS, stage=stage)
+            for stage in RELAY_STAGES
+        ]
+        self._reported = [list(histogram.counts) for histogram in self.histograms]
+
+    def clock(self) -> StageClock:
+        """为一个连接方向创建计时器"""
+        return StageClock(self.histograms)
+
+    def summary(self, since_last: bool = False) -> str:
+        """各阶段的次数与 p50/p99/p999 摘要（毫秒）"""
+        lines = []
+        for index, (stage, histogram) in enumerate(zip(RELAY_STAGES, self.histograms)):
+            counts = list(histogram.counts)
+            if since_last:
+                counts, self._reported[index] = [a - b for a, b in zip(counts, self._reported[index])], counts
+            total = sum(counts)
+            if not total:
+                lines.append(f'  {stage:<12} n=0')
+                continue
+            p50, p99, p999 = (histogram.percentile(q, counts) * 1000 for q in (0.5, 0.99, 0.999))
+            lines.append(f'  {stage:<12} n={total} p50={p50:.3f}ms p99={p99:.3f}ms p999={p999:.3f}ms')
+        return '\n'.join(lines)
+
+
+async def report_stage_timings(timings: StageTimings, interval: float, log: logging.Logger):
+    """
+    定期输出阶段耗时摘要，并在收到 SIGUSR1 时输出启动以来的累计摘要（直到被取消）
+
+    Args:
+        timings: 阶段耗时直方图
+        interval: 周期摘要间隔（秒，0 表示只响应信号）
+        log: 输出摘要的日志器
+    """
+    loop = asyncio.get_running_loop()
+    dump_signal = getattr(signal, 'SIGUSR1', None)
+    installed = False
+    if dump_signal is not None:
+        try:
+            loop.add_signal_handler(dump_signal,
+                                    lambda: log.info('Stage latency since start:\n' + timings.summary()))
+            installed = True
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass
+    try:
+        while True:
+            if not interval:
+                await asyncio.Future()
+            await asyncio.sleep(interval)
+            log.info(f'Stage latency over the last {interval:g}s:\n' + timings.summary(since_last=True))
+    finally:
+        if installed:
+            loop.remove_signal_handler(dump_signal)
+
+
+class MeteredCodec:
+    """
+    统计帧数、字节数和加扰/去加扰耗时的编解码器包装（仅启用指标时使用）
+
+    加扰方向（tx_direction）与去加扰方向（rx_direction）由调用方给出，
+    客户端为 upstream/downstream，服务端相反。其余属性透传给被包装的编解码器。
+    计数器不加锁，只能在事件循环线程中更新：卸载到执行器的帧由 offload.py 在结果返回后调用 record_tx/record_rx。
+    """
+
+    def __init__(self, codec, registry: MetricsRegistry, tx_direction: str, rx_direction: str):
+        self.codec = codec
+        self.tx_frames = registry.counter('frames_total', 'WebSocket frames relayed', direction=tx_direction)
+        self.tx_payload = registry.counter('payload_bytes_total', 'Payload bytes relayed (before obfuscation)',
+                                           direction=tx_direction)
+        self.tx_wire = registry.counter('wire_bytes_total', 'Obfuscated frame bytes on the WebSocket',
+                                        direction=tx_direction)
+        self.rx_frames = registry.counter('frames_total', 'WebSocket frames relayed', direction=rx_direction)
+        self.rx_payload = registry.counter('payload_bytes_total', 'Payload bytes relayed (before obfuscation)',
+                                           direction=rx_direction)
+        self.rx_wire = registry.counter('wire_bytes_total', 'Obfuscated frame bytes on the WebSocket',
+                                        direction=rx_direction)
+        self.obfuscate_seconds = registry.counter('codec_seconds_total', 'Time spent in the obfuscation codec',
+                                                  operation='obfuscate')
+        self.deobfuscate_seconds = registry.counter('codec_seconds_total', 'Time spent in the obfuscation codec',
+                                                    operation='deobfuscate')
+
+    def __getattr__(self, name):
+        return getattr(self.codec, name)
+
+    def record_tx(self, payload_len: int, wire_len: int, seconds: float):
+        """记录一个加扰帧（卸载到执行器的帧不经过本包装，由 offload.py 调用）"""
+        self.obfuscate_seconds.value += seconds
+        self.tx_frames.value += 1
+        self.tx_payload.value += payload_len
+        self.tx_wire.value += wire_len
+
+    def record_rx(self, wire_len: int, payload_len: int, seconds: float):
+        """记录一个去加扰帧"""
+        self.deobfuscate_seconds.value += seconds
+        self.rx_frames.value += 1
+        self.rx_payload.value += payload_len
+        self.rx_wire.value += wire_len
+
+    def obfuscate_into(self, data, buffer: bytearray) -> int:
+        start = time.perf_counter()
+        frame_len = self.codec.obfuscate_into(data, buffer)
+        self.record_tx(len(data), frame_len, time.perf_counter() - start)
+        return frame_len
+
+    def deobfuscate_inplace(self, buffer: bytearray):
+        start = time.perf_counter()
+        wire_len = len(buffer)
+        data = self.codec.deobfuscate_inplace(buffer)
+        self.record_rx(wire_len, len(data), time.perf_counter() - start)
+        return data
+
+
+def worker_address(address: str, index: int) -> str:
+    """多进程模式下第 index 个工作进程的指标地址：TCP 端口加 index，Unix 套接字路径加 .index 后缀"""
+    if address.startswith(UNIX_PREFIX):
+        return f'{address}.{index}'
+    host, _, port = address.rpartition(':')
+    return f'{host}:{int(port) + index}'
+
+
+async def _handle_scrape(registry: MetricsRegistry, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """处理一次 HTTP 抓取请求（GET /metrics 或 GET /）"""
+    try:
+        header = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), CFG_SCRAPE_TIMEOUT)
+        request_line = header.split(b'\r\n', 1)[0].decode('latin-1').split()
+        if len(request_line) >= 2 and request_line[0] == 'GET' and request_line[1] in ('/', '/metrics'):
+            status, body = '200 OK', registry.render().encode()
+        else:
+            status, body = '404 Not Found', b'not found\n'
+        writer.write(f'HTTP/1.0 {status}\r\n'
+                     f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                     f'Content-Length: {len(body)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(registry: MetricsRegistry, address: str) -> Optional[asyncio.AbstractServer]:
+    """
+    启动指标端点
+
+    Args:
+        registry: 指标注册表
+        address: host:port（HTTP）或 unix:/path（基于 Unix 套接字的 HTTP）
+
+    Returns:
+        asyncio 服务器对象
+    """
+    handler = lambda reader, writer: _handle_scrape(registry, reader, writer)
+    if address.startswith(UNIX_PREFIX):
+        path = address[len(UNIX_PREFIX):]
+        server = await asyncio.start_unix_server(handler, path, limit=CFG_SCRAPE_MAX_HEADER)
+    else:
+        host, _, port = address.rpartition(':')
+        server = await asyncio.start_server(handler, host or '127.0.0.1', int(port), limit=CFG_SCRAPE_MAX_HEADER)
+    logger.info(f'Metrics endpoint listening on {address}')
+    return server
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多路复用模块
+在一条 WebSocket 连接上承载多个 TCP 流，省去每个新连接的 TCP/TLS/WebSocket 握手
+
+每条 WebSocket 消息为一个加扰后的复用帧：
+
+    [1 字节类型][4 字节流 ID][载荷]
+
+- OPEN: 客户端新建流（无载荷），随后可立即发送 DATA，无需等待服务端确认
+- DATA: 流数据
+- CLOSE: 流结束（任一端读到 EOF 或出错），另一端关闭对应连接
+- WINDOW: 流量控制，载荷为 4 字节的窗口增量；接收端数据写入本地连接后归还窗口，
+  发送端窗口耗尽时暂停读取，避免慢速流占满内存或阻塞同一 WebSocket 上的其它流
+"""
+
+import asyncio
+import logging
+import struct
+from typing import Awaitable, Callable, Optional
+
+from relay import AdaptiveReadSize, coalesce_reads
+
+# 复用帧类型
+MUX_OPEN = 0
+MUX_DATA = 1
+MUX_CLOSE = 2
+MUX_WINDOW = 3
+
+# 复用帧头：类型 + 流 ID
+MUX_HEADER = struct.Struct('!BI')
+MUX_WINDOW_INCREMENT = struct.Struct('!I')
+
+# 复用连接的 WebSocket 路径后缀（客户端连接 wss_path + MUX_PATH_SUFFIX）
+MUX_PATH_SUFFIX = '/mux'
+
+# 每个流的初始发送窗口（字节），接收端消费过半后归还
+CFG_MUX_WINDOW = 256 * 1024
+
+logger = logging.getLogger('wss-plugin-mux')
+
+
+class MuxStream:
+    """复用连接上的单个流"""
+
+    def __init__(self, stream_id: int, window: int):
+        self.id = stream_id
+        self.send_window = window
+        self.window_event = asyncio.Event()
+        # 收到的 DATA 载荷；None 表示对端已关闭该流
+        self.inbound = asyncio.Queue()
+        self.remote_closed = False
+        self.local_closed = False
+
+
+class MuxSession:
+    """
+    一条 WebSocket 上的复用会话
+
+    所有流的出站帧经同一个队列由单个发送任务加扰并发送，保证有状态编解码器的帧顺序；
+    接收任务按流 ID 分发入站帧。
+    """
+
+    def __init__(self, websocket, tx_codec, rx_codec, max_data: int,
+                 on_open: Optional[Callable[['MuxSession', MuxStream], Awaitable]] = None,
+                 window: int = CFG_MUX_WINDOW):
+        """
+        初始化
+
+        Args:
+            websocket: 已建立的 WebSocket 连接
+            tx_codec: 发送方向的编解码器
+            rx_codec: 接收方向的编解码器
+            max_data: 单个 DATA 帧的最大载荷（不超过 tx_codec.max_payload - MUX_HEADER.size）
+            on_open: 收到 OPEN 时调用的协程函数（服务端）；为 None 时拒绝对端建流（客户端）
+            window: 每个流的初始发送窗口
+        """
+        self.websocket = websocket
+        self.tx_codec = tx_codec
+        self.rx_codec = rx_codec
+        self.max_data = min(max_data, tx_codec.max_payload - MUX_HEADER.size)
+        if self.max_data <= 0:
+            raise ValueError(f'Invalid mux max_data: {max_data}')
+        self.on_open = on_open
+        self.window = window
+
+        self.streams = {}
+        self.closed = False
+        self._next_id = 1
+        self._outbox = asyncio.Queue()
+        self._handlers = set()
+
+    def open_stream(self) -> MuxStream:
+        """新建流并发送 OPEN（客户端），之后即可在该流上发送数据"""
+        if self.closed:
+            raise ConnectionError('Mux session closed')
+        stream = MuxStream(self._next_id, self.window)
+        self._next_id += 1
+        self.streams[stream.id] = stream
+        self._send_frame(MUX_OPEN, stream.id)
+        return stream
+
+    def close_stream(self, stream: MuxStream):
+        """结束流：未收到对端 CLOSE 时发送 CLOSE，并从会话中移除"""
+        if not stream.local_closed:
+            stream.local_closed = True
+            if not stream.remote_closed and not self.closed:
+                self._send_frame(MUX_CLOSE, stream.id)
+        self.streams.pop(stream.id, None)
+
+    def _send_frame(self, frame_type: int, stream_id: int, payload=b''):
+        """将复用帧放入发送队列"""
+        self._outbox.put_nowait(MUX_HEADER.pack(frame_type, stream_id) + payload)
+
+    async def run(self):
+        """运行会话直到 WebSocket 关闭"""
+        sender = asyncio.create_task(self._send_loop())
+        try:
+            await self._recv_loop()
+        except Exception as e:
+            logger.debug('Mux session receive ended: %s', e)
+        finally:
+            self.closed = True
+            sender.cancel()
+            for stream in list(self.streams.values()):
+                stream.remote_closed = True
+                stream.inbound.put_nowait(None)
+                stream.window_event.set()
+            self.streams.clear()
+            for task in list(self._handlers):
+                task.cancel()
+            try:
+                await sender
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.debug('Mux session send ended: %s', e)
+
+    async def _send_loop(self):
+        """发送任务：按入队顺序加扰并发送复用帧"""
+        # 复用的加扰输出缓冲区（send 返回前帧已序列化，可安全复用）
+        tx_buffer = bytearray(self.tx_codec.max_frame_size(self.max_data + MUX_HEADER.size))
+        tx_view = memoryview(tx_buffer)
+        try:
+            while True:
+                frame = await self._outbox.get()
+                frame_len = self.tx_codec.obfuscate_into(frame, tx_buffer)
+                await self.websocket.send(tx_view[:frame_len])
+        finally:
+            # 发送失败时让接收任务退出，进而结束整个会话
+            if not self.closed:
+                await self.websocket.close()
+
+    async def _recv_loop(self):
+        """接收任务：去加扰并按流 ID 分发复用帧"""
+        while True:
+            message = await self.websocket.recv()
+            # 在消息副本上原地去加扰；载荷视图随副本交给流，副本不复用
+            data = self.rx_codec.deobfuscate_inplace(bytearray(message))
+            if len(data) < MUX_HEADER.size:
+                raise ValueError(f'Mux frame too short: {len(data)} bytes')
+            frame_type, stream_id = MUX_HEADER.unpack_from(data)
+            payload = data[MUX_HEADER.size:]
+
+            if frame_type == MUX_DATA:
+                stream = self.streams.get(stream_id)
+                if stream is not None and payload:
+                    stream.inbound.put_nowait(payload)
+            elif frame_type == MUX_WINDOW:
+                stream = self.streams.get(stream_id)
+                if stream is not None:
+                    stream.send_window += MUX_WINDOW_INCREMENT.unpack(payload)[0]
+                    stream.window_event.set()
+            elif frame_type == MUX_CLOSE:
+                stream = self.streams.pop(stream_id, None)
+                if stream is not None:
+                    stream.remote_closed = True
+                    stream.inbound.put_nowait(None)
+                    stream.window_event.set()
+            elif frame_type == MUX_OPEN:
+                self._accept_stream(stream_id)
+            else:
+                raise ValueError(f'Unknown mux frame type: {frame_type}')
+
+    def _accept_stream(self, stream_id: int):
+        """处理对端的 OPEN：登记流并在独立任务中运行 on_open"""
+        if self.on_open is None or stream_id in self.streams:
+            self._send_frame(MUX_CLOSE, stream_id)
+            return
+        stream = MuxStream(stream_id, self.window)
+        self.streams[stream_id] = stream
+        task = asyncio.create_task(self._run_handler(stream))
+        self._handlers.add(task)
+        task.add_done_callback(self._handlers.discard)
+
+    async def _run_handler(self, stream: MuxStream):
+        """运行 on_open，异常时结束该流而不影响会话"""
+        try:
+            await self.on_open(self, stream)
+        except Exception as e:
+            logger.debug('Mux stream %d handler error: %s', stream.id, e)
+        finally:
+            self.close_stream(stream)
+
+    async def relay(self, stream: MuxStream, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                    sizer: AdaptiveReadSize, coalesce_delay: float = 0, coalesce_max: int = 0):
+        """
+        在流与本地 TCP 连接之间双向转发，任一方向结束时关闭流和连接
+
+        Args:
+            stream: 复用流
+            reader / writer: 本地 TCP 连接
+            sizer: 出站方向的读取大小策略（上限不超过 max_data）
+            coalesce_delay: 写合并等待时间（秒，0 表示不合并）
+            coalesce_max: 写合并后的最大字节数
+        """
+        to_mux = asyncio.create_task(self._relay_to_mux(stream, reader, sizer, coalesce_delay, coalesce_max))
+        from_mux = asyncio.create_task(self._relay_from_mux(stream, writer))
+        try:
+            done, pending = await asyncio.wait([to_mux, from_mux], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (to_mux, from_mux):
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                except Exception as e:
+                    logger.debug('Mux stream %d relay error: %s', stream.id, e)
+            self.close_stream(stream)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _relay_to_mux(self, stream: MuxStream, reader: asyncio.StreamReader,
+                            sizer: AdaptiveReadSize, coalesce_delay: float, coalesce_max: int):
+        """本地连接 -> 复用流"""
+        read_size = sizer.size
+        coalesce_max = min(coalesce_max or sizer.ceiling, sizer.ceiling, self.max_data)
+        eof = False
+        try:
+            while not stream.remote_closed:
+                data = await reader.read(min(read_size, self.max_data))
+                if not data:
+                    break
+
+                if coalesce_delay:
+                    data, eof = await coalesce_reads(reader, data, coalesce_max, coalesce_delay)
+
+                # 窗口耗尽时等待对端归还（允许超出一帧）
+                while stream.send_window <= 0 and not stream.remote_closed:
+                    stream.window_event.clear()
+                    await stream.window_event.wait()
+                if stream.remote_closed or self.closed:
+                    break
+
+                stream.send_window -= len(data)
+                self._send_frame(MUX_DATA, stream.id, data)
+                read_size = sizer.update(len(data))
+                if eof:
+                    break
+        finally:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Mux stream %d read stats: %s', stream.id, sizer.stats())
+
+    async def _relay_from_mux(self, stream: MuxStream, writer: asyncio.StreamWriter):
+        """复用流 -> 本地连接，写入后归还窗口"""
+        consumed = 0
+        while True:
+            data = await stream.inbound.get()
+            if data is None:
+                break
+            writer.write(data)
+            await writer.drain()
+
+            consumed += len(data)
+            if consumed * 2 >= self.window and not self.closed and not stream.remote_closed:
+                self._send_frame(MUX_WINDOW, stream.id, MUX_WINDOW_INCREMENT.pack(consumed))
+                consumed = 0
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+加扰卸载模块
+把超过阈值的大帧交给执行器加扰/去加扰，避免单个大帧阻塞事件循环上的其它连接；小帧仍在事件循环内联处理
+
+C 加速实现处理大缓冲区时释放 GIL，此时使用线程池；否则使用进程池（有状态编解码器的逐帧状态
+无法跨进程保存，进程池模式下仍内联处理）。每个连接方向逐帧等待结果，帧顺序不变。
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from obfuscator import RELEASES_GIL, codec_from_subprotocol, create_codec
+from relay import obfuscate_frame
+
+# 默认卸载阈值（字节）：小于该长度的帧内联处理
+CFG_OFFLOAD_THRESHOLD = 64 * 1024
+
+# 进程池工作进程内按 (编解码器, 密钥, 参数) 缓存的编解码器实例
+_worker_codecs = {}
+
+
+def _worker_codec(spec: tuple):
+    """进程池工作进程：返回缓存的编解码器实例"""
+    codec = _worker_codecs.get(spec)
+    if codec is None:
+        name, key, options = spec
+        codec = _worker_codecs[spec] = create_codec(name, key, **dict(options))
+    return codec
+
+
+def _process_obfuscate(spec: tuple, data: bytes) -> bytes:
+    """进程池工作进程：加扰"""
+    return _worker_codec(spec).obfuscate(data)
+
+
+def _process_deobfuscate(spec: tuple, data: bytes) -> bytes:
+    """进程池工作进程：去加扰"""
+    return _worker_codec(spec).deobfuscate(data)
+
+
+def _thread_deobfuscate(codec, message) -> memoryview:
+    """线程池：在消息副本上原地去加扰"""
+    return codec.deobfuscate_inplace(bytearray(message))
+
+
+class CodecOffload:
+    """加扰执行器（整个进程共享，首次卸载时才创建，多进程服务端的监督进程不会创建）"""
+
+    def __init__(self, threshold: int = CFG_OFFLOAD_THRESHOLD, workers: Optional[int] = None):
+        """
+        初始化
+
+        Args:
+            threshold: 卸载阈值（字节），帧长度达到该值时交给执行器
+            workers: 执行器的线程/进程数，默认为 CPU 核数
+        """
+        if threshold <= 0:
+            raise ValueError(f'Invalid offload threshold: {threshold}')
+        self.threshold = threshold
+        self.workers = workers or os.cpu_count() or 1
+        self.use_threads = RELEASES_GIL
+        self._executor = None
+
+    @property
+    def executor(self):
+        """线程池或进程池（首次访问时创建）"""
+        if self._executor is None:
+            if self.use_threads:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='wss-obfs')
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    @property
+    def kind(self) -> str:
+        """执行器类型（用于日志）"""
+        return 'thread' if self.use_threads else 'process'
+
+    def bind(self, codec, key: str, subprotocol: Optional[str]) -> Optional['OffloadedCodec']:
+        """
+        为一个连接方向的编解码器创建卸载包装
+
+        Args:
+            codec: 该方向使用的编解码器实例
+            key: 加扰密钥（进程池中重建编解码器）
+            subprotocol: 协商的子协议（进程池中重建编解码器）
+
+        Returns:
+            OffloadedCodec；编解码器无需卸载或无法卸载时返回 None
+        """
+        if not getattr(codec, 'cpu_bound', True):
+            return None
+        if not self.use_threads and codec.stateful:
+            return None
+        name, options = codec_from_subprotocol(subprotocol)
+        return OffloadedCodec(self, codec, (name, key, tuple(sorted(options.items()))))
+
+    def shutdown(self):
+        """关闭执行器（尚未创建时无操作）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class OffloadedCodec:
+    """
+    单个连接方向的卸载包装：调用方对达到 threshold 的帧使用这里的协程方法
+
+    执行器中只调用未包装的编解码器（进程池在工作进程中重建编解码器）；帧统计在结果返回后于事件循环线程
+    通过指标包装的 record_tx/record_rx 记录，计数器不会被执行器线程并发修改。耗时为执行器耗时
+    （进程池模式含进程间传输）。
+    """
+
+    def __init__(self, offload: CodecOffload, codec, spec: tuple):
+        self.offload = offload
+        self.spec = spec
+        self.threshold = offload.threshold
+        # 指标包装（metrics.MeteredCodec）的记录方法，未启用指标时为 None
+        self.record_tx = getattr(codec, 'record_tx', None)
+        self.record_rx = getattr(codec, 'record_rx', None)
+        # 线程池中使用的编解码器：启用指标时取被包装的实例
+        self.codec = codec.codec if self.record_tx else codec
+
+    async def obfuscate(self, data):
+        """在执行器中加扰，返回新的帧"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        if self.offload.use_threads:
+            frame = await loop.run_in_executor(self.offload.executor, obfuscate_frame, self.codec, data)
+        else:
+            frame = await loop.run_in_executor(self.offload.executor, _process_obfuscate, self.spec, bytes(data))
+        if self.record_tx:
+            self.record_tx(len(data), len(frame), time.perf_counter() - start)
+        return frame
+
+    async def obfuscate_into(self, data, buffer: bytearray) -> int:
+        """在执行器中加扰到调用方的缓冲区（进程池模式下多一次复制），返回帧长度"""
+        if not self.offload.use_threads:
+            frame = await self.obfuscate(data)
+            buffer[:len(frame)] = frame
+            return len(frame)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        frame_len = await loop.run_in_executor(self.offload.executor, self.codec.obfuscate_into, data, buffer)
+        if self.record_tx:
+            self.record_tx(len(data), frame_len, time.perf_counter() - start)
+        return frame_len
+
+    async def deobfuscate(self, message):
+        """在执行器中去加扰，返回原始数据"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        if self.offload.use_threads:
+            data = await loop.run_in_executor(self.offload.executor, _thread_deobfuscate, self.codec, message)
+        else:
+            data = await loop.run_in_executor(self.offload.executor, _process_deobfuscate, self.spec, bytes(message))
+        if self.record_rx:
+            self.record_rx(len(message), len(data), time.perf_counter() - start)
+        return data
+
+
+def pipeline_obfuscator(codec, offloaded: Optional[OffloadedCodec]):
+    """返回流水线的加扰变换：未启用卸载时为普通函数，否则大帧交给执行器"""
+    if offloaded is None:
+        return lambda data: obfuscate_frame(codec, data)
+
+    async def transform(data):
+        if len(data) >= offloaded.threshold:
+            return await offloaded.obfuscate(data)
+        return obfuscate_frame(codec, data)
+
+    return transform
+
+
+def pipeline_deobfuscator(codec, offloaded: Optional[OffloadedCodec]):
+    """返回流水线的去加扰变换：未启用卸载时为普通函数，否则大帧交给执行器"""
+    if offloaded is None:
+        return lambda message: codec.deobfuscate_inplace(bytearray(message))
+
+    async def transform(message):
+        if len(message) >= offloaded.threshold:
+            return await offloaded.deobfuscate(message)
+        return codec.deobfuscate_inplace(bytearray(message))
+
+    return transform
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+连接池模块
+预先建立连接并保持一定数量的空闲连接，新请求直接取用，把建连延迟移出关键路径
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+# 默认空闲连接数下限/上限与最长空闲时间（秒）
+CFG_POOL_MIN_IDLE = 2
+CFG_POOL_MAX_IDLE = 8
+CFG_POOL_MAX_AGE = 30
+
+# 后台巡检（过期清理与健康检查）的间隔上限（秒）
+CFG_POOL_SWEEP_INTERVAL = 10
+
+# 建连失败后的重试退避（秒）
+CFG_POOL_RETRY_MIN = 1
+CFG_POOL_RETRY_MAX = 30
+
+logger = logging.getLogger('wss-plugin-pool')
+
+
+class ConnectionPool:
+    """
+    预建连接池（连接只使用一次，取出后由调用方负责关闭）
+
+    空闲目标数在 [min_idle, max_idle] 之间自适应：取用时池为空则增加，
+    空闲连接因过期被丢弃则减少。后台任务负责补充、过期清理和健康检查。
+    """
+
+    def __init__(self, connect: Callable[[], Awaitable[Any]], close: Callable[[Any], Awaitable],
+                 is_alive: Callable[[Any], bool] = lambda conn: True,
+                 check: Optional[Callable[[Any], Awaitable[bool]]] = None,
+                 min_idle: int = CFG_POOL_MIN_IDLE, max_idle: int = CFG_POOL_MAX_IDLE,
+                 max_age: float = CFG_POOL_MAX_AGE, name: str = 'pool'):
+        """
+        初始化
+
+        Args:
+            connect: 建立新连接的协程函数，失败时抛出异常或返回 None
+            close: 关闭连接的协程函数
+            is_alive: 取用时的快速存活判断（不做网络交互）
+            check: 后台巡检时的健康检查协程（如 WebSocket ping），返回 False 时丢弃连接
+            min_idle: 空闲连接数下限
+            max_idle: 空闲连接数上限
+            max_age: 连接建立后可空闲的最长时间（秒），超过后丢弃
+            name: 日志中的池名称
+        """
+        if min_idle < 0 or max_idle < min_idle:
+            raise ValueError(f'Invalid pool size: min_idle={min_idle}, max_idle={max_idle}')
+        if max_age <= 0:
+            raise ValueError(f'Invalid pool max_age: {max_age}')
+        self._connect = connect
+        self._close = close
+        self.is_alive = is_alive
+        self.check = check
+        self.min_idle = min_idle
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.name = name
+
+        self.target = min_idle
+        self._idle = deque()  # (连接, 建立时间)
+        self._connecting = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._discarding = set()  # 已从池中移除、正在后台关闭的连接
+
+        # 调试统计
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.failed = 0
+
+    @property
+    def idle(self) -> int:
+        """当前空闲连接数"""
+        return len(self._idle)
+
+    def start(self):
+        """启动后台补充任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        """停止后台任务并关闭所有空闲连接"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._idle:
+            conn, _ = self._idle.popleft()
+            await self._discard(conn)
+        if self._discarding:
+            await asyncio.gather(*self._discarding, return_exceptions=True)
+
+    async def acquire(self):
+        """
+        取出一个连接：优先使用最新的空闲连接，池为空时直接建连
+
+        Returns:
+            连接对象（connect 返回 None 时为 None）
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        while self._idle:
+            conn, created = self._idle.pop()
+            if now - created < self.max_age and self.is_alive(conn):
+                self.hits += 1
+                self._wakeup.set()
+                return conn
+            self.expired += 1
+            self._discard_later(conn)
+
+        # 池为空：提高空闲目标数以应对突发，并立即建连
+        self.misses += 1
+        self.target = min(self.target + 1, self.max_idle)
+        self._wakeup.set()
+        return await self._connect()
+
+    async def _discard(self, conn):
+        """关闭不再使用的连接"""
+        try:
+            await self._close(conn)
+        except Exception as e:
+            logger.debug('%s: error closing pooled connection: %s', self.name, e)
+
+    def _discard_later(self, conn):
+        """在后台关闭连接，不阻塞取用与巡检；close() 时等待这些任务结束"""
+        task = asyncio.create_task(self._discard(conn))
+        self._discarding.add(task)
+        task.add_done_callback(self._discarding.discard)
+
+    async def _fill_one(self) -> bool:
+        """建立一个空闲连接，返回是否成功"""
+        self._connecting += 1
+        try:
+            conn = await self._connect()
+        except Exception as e:
+            logger.debug('%s: pre-connect failed: %s', self.name, e)
+            conn = None
+        finally:
+            self._connecting -= 1
+        if conn is None:
+            self.failed += 1
+            return False
+        self._idle.append((conn, asyncio.get_running_loop().time()))
+        return True
+
+    async def _healthy(self, conn, created: float, now: float, with_check: bool) -> bool:
+        """判断空闲连接是否仍可用"""
+        if now - created >= self.max_age or not self.is_alive(conn):
+            return False
+        if with_check and self.check is not None:
+            try:
+                return await self.check(conn)
+            except Exception:
+                return False
+        return True
+
+    async def _sweep(self, with_check: bool):
+        """丢弃过期、已断开或健康检查失败的空闲连接（健康检查并发进行）"""
+        now = asyncio.get_running_loop().time()
+        entries = list(self._idle)
+        results = await asyncio.gather(*(
+            self._healthy(conn, created, now, with_check) for conn, created in entries
+        ))
+        for (conn, created), healthy in zip(entries, results):
+            if healthy:
+                continue
+            try:
+                self._idle.remove((conn, created))
+            except ValueError:
+                continue  # 巡检期间已被取走
+            self.expired += 1
+            # 空闲连接无人使用直至过期，说明目标数偏大
+            self.target = max(self.target - 1, self.min_idle)
+            self._discard_later(conn)
+
+    async def _maintain(self):
+        """后台任务：补充空闲连接并定期巡检"""
+        retry_delay = CFG_POOL_RETRY_MIN
+        interval = min(self.max_age / 2, CFG_POOL_SWEEP_INTERVAL)
+        loop = asyncio.get_running_loop()
+        last_check = loop.time()
+        while True:
+            # 先清除唤醒标志，补充期间的取用会重新置位
+            self._wakeup.clear()
+            # 取用唤醒时只清理过期连接，健康检查按巡检间隔进行
+            with_check = loop.time() - last_check >= interval
+            if with_check:
+                last_check = loop.time()
+            await self._sweep(with_check)
+
+            missing = self.target - len(self._idle) - self._connecting
+            if missing > 0:
+                results = await asyncio.gather(*(self._fill_one() for _ in range(missing)))
+                if not all(results):
+                    # 服务端不可用时退避，避免反复建连
+                    await asyncio.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, CFG_POOL_RETRY_MAX)
+                    continue
+                retry_delay = CFG_POOL_RETRY_MIN
+                logger.debug('%s: %d idle (target %d, hits=%d, misses=%d, expired=%d)', self.name,
+                             len(self._idle), self.target, self.hits, self.misses, self.expired)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
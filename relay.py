@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+中继辅助模块
+客户端与服务端转发循环共用的读写策略
+"""
+
+import asyncio
+import signal
+import socket
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+# 自适应读取大小的默认下限与初始值
+CFG_ADAPTIVE_READ_MIN = 4 * 1024  # 4KB
+CFG_ADAPTIVE_READ_INITIAL = 8 * 1024  # 8KB（与原固定读取大小一致）
+
+# 连续多少次读取不足当前大小的 1/4 后缩小一档
+CFG_ADAPTIVE_SHRINK_AFTER = 4
+
+# 写合并默认的最大等待时间（毫秒，0 表示不合并）
+CFG_COALESCE_DELAY_MS = 0
+
+# TCP keepalive 探测间隔与次数（空闲时间由 keepalive 选项指定）
+CFG_KEEPALIVE_INTERVAL = 10
+CFG_KEEPALIVE_COUNT = 3
+
+# 流水线模式下每个方向每个队列的默认高水位（字节）
+CFG_PIPELINE_HIGH_WATER = 1024 * 1024  # 1MB
+
+
+class AdaptiveReadSize:
+    """
+    单个连接方向的自适应读取大小
+
+    读取填满当前大小时视为批量传输，读取大小翻倍直至上限，减少大流量下每帧的
+    加扰、WebSocket 分帧和 TLS 记录开销；连续多次读取远小于当前大小时视为交互式流量，
+    读取大小减半直至下限，避免为小包分配和加扰过大的缓冲区。
+    """
+
+    def __init__(self, ceiling: int, floor: int = CFG_ADAPTIVE_READ_MIN,
+                 initial: int = CFG_ADAPTIVE_READ_INITIAL, adaptive: bool = True):
+        """
+        初始化
+
+        Args:
+            ceiling: 读取大小上限（通常为 min(read_buf_size, 编解码器 max_payload)）
+            floor: 读取大小下限
+            initial: 初始读取大小
+            adaptive: False 时固定使用 ceiling（原有行为）
+        """
+        if ceiling <= 0:
+            raise ValueError(f'Invalid read size ceiling: {ceiling}')
+        self.ceiling = ceiling
+        if adaptive:
+            self.floor = max(1, min(floor, ceiling))
+            self.size = max(self.floor, min(initial, ceiling))
+        else:
+            self.floor = self.size = ceiling
+
+        self._small_reads = 0
+
+        # 调试统计
+        self.reads = 0
+        self.bytes = 0
+        self.grows = 0
+        self.shrinks = 0
+        self.peak = self.size
+
+    def update(self, data_len: int) -> int:
+        """
+        根据一次读取的实际长度调整读取大小
+
+        Args:
+            data_len: 本次读取到的字节数
+
+        Returns:
+            下一次读取使用的大小
+        """
+        self.reads += 1
+        self.bytes += data_len
+
+        if data_len >= self.size:
+            self._small_reads = 0
+            if self.size < self.ceiling:
+                self.size = min(self.size * 2, self.ceiling)
+                self.grows += 1
+                if self.size > self.peak:
+                    self.peak = self.size
+        elif data_len * 4 < self.size:
+            self._small_reads += 1
+            if self._small_reads >= CFG_ADAPTIVE_SHRINK_AFTER and self.size > self.floor:
+                self.size = max(self.size // 2, self.floor)
+                self.shrinks += 1
+                self._small_reads = 0
+        else:
+            self._small_reads = 0
+
+        return self.size
+
+    def stats(self) -> dict:
+        """返回该连接方向的调试统计"""
+        return {
+            'size': self.size,
+            'floor': self.floor,
+            'ceiling': self.ceiling,
+            'peak': self.peak,
+            'reads': self.reads,
+            'bytes': self.bytes,
+            'grows': self.grows,
+            'shrinks': self.shrinks,
+        }
+
+
+async def coalesce_reads(reader: asyncio.StreamReader, data: bytes, max_size: int, delay: float) -> tuple:
+    """
+    写合并（类似 Nagle 算法）：在 delay 秒内继续读取，把多次小读取合并为一帧
+
+    首次读取已达到 max_size 时直接返回；合并期间读到 EOF 时返回已合并的数据，
+    并通过返回值通知调用方在发送后结束转发。
+
+    Args:
+        reader: 数据来源
+        data: 首次读取到的数据
+        max_size: 合并后的最大字节数（不超过发送缓冲区对应的读取上限）
+        delay: 最长等待时间（秒）
+
+    Returns:
+        (合并后的数据, 是否已读到 EOF)
+    """
+    total = len(data)
+    if total >= max_size:
+        return data, False
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + delay
+    chunks = [data]
+    eof = False
+    while total < max_size:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            # StreamReader.read 在取消时不会丢失已缓冲的数据
+            more = await asyncio.wait_for(reader.read(max_size - total), timeout)
+        except asyncio.TimeoutError:
+            break
+        if not more:
+            eof = True
+            break
+        chunks.append(more)
+        total += len(more)
+
+    if len(chunks) == 1:
+        return data, eof
+    return b''.join(chunks), eof
+
+
+class ByteBoundedQueue:
+    """
+    按字节数限流的队列
+
+    排队字节数达到高水位时 put 阻塞，直到被取走到低水位以下才恢复，
+    使上游阶段暂停读取而不是无限缓存。
+    """
+
+    def __init__(self, high_water: int, low_water: Optional[int] = None):
+        """
+        初始化
+
+        Args:
+            high_water: 高水位（字节），达到后暂停写入
+            low_water: 低水位（字节），降到该值及以下后恢复写入，默认为高水位的一半
+        """
+        if high_water <= 0:
+            raise ValueError(f'Invalid high_water: {high_water}')
+        self.high_water = high_water
+        self.low_water = high_water // 2 if low_water is None else min(low_water, high_water)
+        self.size = 0
+        self.paused = False
+        self._items = deque()
+        self._not_empty = asyncio.Event()
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+
+        # 调试统计
+        self.pauses = 0
+        self.peak = 0
+
+    async def put(self, item, size: int):
+        """放入一项（size 为其字节数），高水位暂停期间等待"""
+        while self.paused:
+            await self._resumed.wait()
+        self._items.append((item, size))
+        self.size += size
+        if self.size > self.peak:
+            self.peak = self.size
+        self._not_empty.set()
+        if self.size >= self.high_water:
+            self.paused = True
+            self.pauses += 1
+            self._resumed.clear()
+
+    async def get(self):
+        """取出一项，队列为空时等待"""
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        item, size = self._items.popleft()
+        self.size -= size
+        if self.paused and self.size <= self.low_water:
+            self.paused = False
+            self._resumed.set()
+        return item
+
+
+async def run_pipeline(read: Callable[[], Awaitable], transform: Callable, write: Callable[[Any], Awaitable],
+                       high_water: int, low_water: Optional[int] = None) -> dict:
+    """
+    以 读取 -> 变换 -> 写出 三个独立阶段运行单向转发，阶段之间用 ByteBoundedQueue 连接
+
+    读取与写出互不等待：写出阻塞在网络上时读取继续进行，直到队列达到高水位。
+    任一阶段异常时取消其它阶段并向上抛出；读取返回 None（EOF）时排空队列后正常结束。
+
+    Args:
+        read: 读取协程函数，返回数据或 None（EOF）
+        transform: 变换函数（如加扰/去加扰），可以是普通函数或协程函数
+        write: 写出协程函数
+        high_water / low_water: 每个队列的高/低水位（字节）
+
+    Returns:
+        两个队列的调试统计
+    """
+    transform_is_async = asyncio.iscoroutinefunction(transform)
+    raw_queue = ByteBoundedQueue(high_water, low_water)
+    out_queue = ByteBoundedQueue(high_water, low_water)
+
+    async def reader_stage():
+        while True:
+            data = await read()
+            if data is None:
+                await raw_queue.put(None, 0)
+                return
+            await raw_queue.put(data, len(data))
+
+    async def transform_stage():
+        while True:
+            data = await raw_queue.get()
+            if data is None:
+                await out_queue.put(None, 0)
+                return
+            result = await transform(data) if transform_is_async else transform(data)
+            await out_queue.put(result, len(result))
+
+    async def writer_stage():
+        while True:
+            data = await out_queue.get()
+            if data is None:
+                return
+            await write(data)
+
+    stages = [
+        asyncio.create_task(reader_stage()),
+        asyncio.create_task(transform_stage()),
+        asyncio.create_task(writer_stage()),
+    ]
+    try:
+        # 写出阶段结束即全部完成；其它阶段异常时提前返回
+        pending = set(stages)
+        while stages[2] in pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    finally:
+        for task in stages:
+            task.cancel()
+        await asyncio.gather(*stages, return_exceptions=True)
+
+    return {
+        'raw_peak': raw_queue.peak,
+        'raw_pauses': raw_queue.pauses,
+        'out_peak': out_queue.peak,
+        'out_pauses': out_queue.pauses,
+    }
+
+
+def stream_source(reader: asyncio.StreamReader, sizer: AdaptiveReadSize,
+                  coalesce_delay: float = 0, coalesce_max: int = 0) -> Callable[[], Awaitable]:
+    """
+    返回 run_pipeline 使用的 TCP 读取函数（含自适应读取大小与写合并），EOF 时返回 None
+
+    Args:
+        reader: 数据来源
+        sizer: 读取大小策略
+        coalesce_delay: 写合并等待时间（秒，0 表示不合并）
+        coalesce_max: 写合并后的最大字节数（默认为读取上限）
+    """
+    coalesce_max = min(coalesce_max or sizer.ceiling, sizer.ceiling)
+    eof = False
+
+    async def read():
+        nonlocal eof
+        if eof:
+            return None
+        data = await reader.read(sizer.size)
+        if not data:
+            return None
+        if coalesce_delay:
+            data, eof = await coalesce_reads(reader, data, coalesce_max, coalesce_delay)
+        sizer.update(len(data))
+        return data
+
+    return read
+
+
+def obfuscate_frame(obfuscator, data) -> memoryview:
+    """加扰到新分配的缓冲区（帧在队列中排队，不能复用同一缓冲区）"""
+    buffer = bytearray(obfuscator.max_frame_size(len(data)))
+    return memoryview(buffer)[:obfuscator.obfuscate_into(data, buffer)]
+
+
+async def wait_for_shutdown():
+    """
+    等待 SIGTERM/SIGINT，用于 daemon 模式的优雅退出
+
+    平台不支持 add_signal_handler（如 Windows）时一直等待，由 KeyboardInterrupt 或取消结束。
+    """
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    installed = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+            installed.append(sig)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass
+    try:
+        await stopping.wait()
+    finally:
+        for sig in installed:
+            loop.remove_signal_handler(sig)
+
+
+def install_uvloop() -> bool:
+    """
+    使用 uvloop 作为事件循环（需在 asyncio.run 之前调用）
+
+    Returns:
+        是否已启用；未安装 uvloop 时返回 False，继续使用默认事件循环
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def tune_socket(sock: Optional[socket.socket], nodelay: bool = False, sndbuf: int = 0, rcvbuf: int = 0,
+                keepalive: int = 0):
+    """
+    设置 TCP 套接字选项（不支持的选项静默跳过）
+
+    Args:
+        sock: 套接字（StreamWriter.get_extra_info('socket')，为 None 时不做任何操作）
+        nodelay: 是否设置 TCP_NODELAY
+        sndbuf / rcvbuf: 发送/接收缓冲区大小（字节，0 表示使用系统默认）
+        keepalive: TCP keepalive 空闲时间（秒，0 表示不启用）
+    """
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    if nodelay:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if sndbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    if keepalive:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for name, value in (('TCP_KEEPIDLE', keepalive),
+                            ('TCP_KEEPINTVL', CFG_KEEPALIVE_INTERVAL),
+                            ('TCP_KEEPCNT', CFG_KEEPALIVE_COUNT)):
+            if hasattr(socket, name):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
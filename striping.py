@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+条带化模块
+把单个 TCP 流分散到 K 条并行的 WebSocket（通道）上，突破单条 TCP/TLS 连接的拥塞窗口与单核加密上限
+
+客户端为每个流生成随机流 ID，以 wss_path + STRIPE_PATH_SUFFIX + '?flow=<ID>&lanes=<K>&lane=<i>'
+建立 K 条通道，服务端按流 ID 将通道归为一组，全部到齐后连接后端。
+
+每条 WebSocket 消息为一个加扰后的条带帧：
+
+    [8 字节序号][载荷]
+
+两个方向都按序号条带化：发送端各通道从共享队列取帧（空闲的通道先取，自然负载均衡），
+接收端按序号重排后写入本地连接。载荷为空的帧表示 EOF。
+"""
+
+import asyncio
+import logging
+import os
+import struct
+from typing import Optional
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from relay import AdaptiveReadSize, coalesce_reads
+
+# 条带帧头：序号
+STRIPE_HEADER = struct.Struct('!Q')
+
+# 条带通道的 WebSocket 路径后缀
+STRIPE_PATH_SUFFIX = '/stripe'
+
+# 单个流的最大通道数
+CFG_STRIPE_MAX_LANES = 16
+
+# 接收端乱序缓存上限（字节），达到后乱序到达的通道暂停接收，等待缺失的帧
+CFG_STRIPE_REORDER_BUFFER = 4 * 1024 * 1024  # 4MB
+
+# 服务端等待同组通道全部到齐的超时（秒）
+CFG_STRIPE_GROUP_TIMEOUT = 10
+
+logger = logging.getLogger('wss-plugin-stripe')
+
+
+def new_flow_id() -> str:
+    """生成随机流 ID"""
+    return os.urandom(8).hex()
+
+
+def stripe_path(base: str, flow_id: str, lanes: int, lane: int) -> str:
+    """返回第 lane 条通道的 WebSocket 路径"""
+    return f'{base}{STRIPE_PATH_SUFFIX}?' + urlencode({'flow': flow_id, 'lanes': lanes, 'lane': lane})
+
+
+def parse_stripe_path(path: str) -> Optional[tuple]:
+    """
+    解析条带通道路径
+
+    Returns:
+        (流 ID, 通道数, 通道序号)；不是条带通道路径时返回 None
+
+    Raises:
+        ValueError: 条带参数无效
+    """
+    parts = urlsplit(path)
+    if not parts.path.endswith(STRIPE_PATH_SUFFIX):
+        return None
+    query = parse_qs(parts.query)
+    try:
+        flow_id = query['flow'][0]
+        lanes = int(query['lanes'][0])
+        lane = int(query['lane'][0])
+    except (KeyError, ValueError):
+        raise ValueError(f'Invalid stripe path: {path}')
+    if not 2 <= lanes <= CFG_STRIPE_MAX_LANES or not 0 <= lane < lanes:
+        raise ValueError(f'Invalid stripe lanes: lanes={lanes}, lane={lane}')
+    return flow_id, lanes, lane
+
+
+class StripeGroup:
+    """服务端按流 ID 收集的一组通道"""
+
+    def __init__(self, lanes: int):
+        self.lanes = lanes
+        self.websockets = [None] * lanes
+        self.complete = asyncio.Event()
+        # 流结束时完成，各通道的连接处理函数在此之前保持连接
+        self.finished = asyncio.get_running_loop().create_future()
+
+    def add(self, lane: int, websocket):
+        """登记一条通道，全部到齐时置位 complete"""
+        if self.websockets[lane] is not None:
+            raise ValueError(f'Duplicate stripe lane: {lane}')
+        self.websockets[lane] = websocket
+        if all(ws is not None for ws in self.websockets):
+            self.complete.set()
+
+
+class StripedFlow:
+    """在 K 条通道上双向条带化转发单个 TCP 流"""
+
+    def __init__(self, websockets: list, tx_codecs: list, rx_codecs: list, max_data: int,
+                 reorder_limit: int = CFG_STRIPE_REORDER_BUFFER):
+        """
+        初始化
+
+        Args:
+            websockets: 各通道的 WebSocket 连接
+            tx_codecs / rx_codecs: 各通道发送/接收方向的编解码器
+            max_data: 单帧最大载荷（不超过编解码器 max_payload - STRIPE_HEADER.size）
+            reorder_limit: 接收端乱序缓存上限（字节）
+        """
+        self.websockets = websockets
+        self.tx_codecs = tx_codecs
+        self.rx_codecs = rx_codecs
+        self.max_data = min([max_data] + [codec.max_payload - STRIPE_HEADER.size for codec in tx_codecs])
+        if self.max_data <= 0:
+            raise ValueError(f'Invalid stripe max_data: {max_data}')
+        self.reorder_limit = reorder_limit
+
+        # 发送端：共享帧队列，None 为 EOF 标记（每条通道一个）
+        self._outbox = asyncio.Queue(maxsize=len(websockets) * 2)
+        self._send_seq = 0
+        self._eof_sent = False
+
+        # 接收端：乱序缓存
+        self._next_seq = 0
+        self._reorder = {}
+        self._reorder_bytes = 0
+        self._drained = asyncio.Event()
+        self._inbound_eof = False
+
+        # 调试统计
+        self.frames_sent = [0] * len(websockets)
+        self.reorder_peak = 0
+
+    async def relay(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                    sizer: AdaptiveReadSize, coalesce_delay: float = 0, coalesce_max: int = 0):
+        """
+        在本地 TCP 连接与各通道之间双向转发，任一方向结束时关闭本地连接
+
+        Args:
+            reader / writer: 本地 TCP 连接
+            sizer: 出站方向的读取大小策略（上限不超过 max_data）
+            coalesce_delay: 写合并等待时间（秒，0 表示不合并）
+            coalesce_max: 写合并后的最大字节数
+        """
+        lanes = range(len(self.websockets))
+        local_reader = asyncio.create_task(self._read_local(reader, sizer, coalesce_delay, coalesce_max))
+        senders = [asyncio.create_task(self._lane_sender(lane)) for lane in lanes]
+        receivers = [asyncio.create_task(self._lane_receiver(lane, writer)) for lane in lanes]
+        outbound = {local_reader, *senders}
+        try:
+            # 直接等待各任务：任一接收任务结束、任一任务出错或出站方向全部完成时结束
+            pending = {*outbound, *receivers}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+                if not outbound & pending or any(task in done for task in receivers):
+                    break
+        finally:
+            for task in (local_reader, *senders, *receivers):
+                task.cancel()
+            await asyncio.gather(local_reader, *senders, *receivers, return_exceptions=True)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Striped flow closed: frames per lane=%s, reorder peak=%d bytes, read stats=%s',
+                             self.frames_sent, self.reorder_peak, sizer.stats())
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _read_local(self, reader: asyncio.StreamReader, sizer: AdaptiveReadSize,
+                          coalesce_delay: float, coalesce_max: int):
+        """本地连接 -> 共享帧队列，按读取顺序分配序号"""
+        read_size = min(sizer.size, self.max_data)
+        coalesce_max = min(coalesce_max or sizer.ceiling, sizer.ceiling, self.max_data)
+        eof = False
+        while not eof:
+            data = await reader.read(read_size)
+            if not data:
+                break
+            if coalesce_delay:
+                data, eof = await coalesce_reads(reader, data, coalesce_max, coalesce_delay)
+            await self._outbox.put((self._send_seq, data))
+            self._send_seq += 1
+            read_size = min(sizer.update(len(data)), self.max_data)
+        for _ in self.websockets:
+            await self._outbox.put(None)
+
+    async def _lane_sender(self, lane: int):
+        """通道发送任务：从共享队列取帧，加扰后发送；收到 EOF 标记时退出"""
+        websocket = self.websockets[lane]
+        codec = self.tx_codecs[lane]
+        # 每条通道复用的加扰输出缓冲区（send 返回前帧已序列化，可安全复用）
+        tx_buffer = bytearray(codec.max_frame_size(self.max_data + STRIPE_HEADER.size))
+        tx_view = memoryview(tx_buffer)
+        while True:
+            item = await self._outbox.get()
+            if item is None:
+                if self._eof_sent:
+                    return
+                # 第一条取到 EOF 标记的通道发送 EOF 帧（序号紧随最后一个数据帧）
+                self._eof_sent = True
+                seq, data = self._send_seq, b''
+            else:
+                seq, data = item
+            frame_len = codec.obfuscate_into(STRIPE_HEADER.pack(seq) + data, tx_buffer)
+            await websocket.send(tx_view[:frame_len])
+            self.frames_sent[lane] += 1
+            if item is None:
+                return
+
+    async def _lane_receiver(self, lane: int, writer: asyncio.StreamWriter):
+        """通道接收任务：去加扰并按序号交付，收到 EOF 并交付完毕后返回"""
+        websocket = self.websockets[lane]
+        codec = self.rx_codecs[lane]
+        while not self._inbound_eof:
+            message = await websocket.recv()
+            data = codec.deobfuscate_inplace(bytearray(message))
+            if len(data) < STRIPE_HEADER.size:
+                raise ValueError(f'Stripe frame too short: {len(data)} bytes')
+            seq, = STRIPE_HEADER.unpack_from(data)
+            await self._deliver(seq, data[STRIPE_HEADER.size:], writer)
+
+    async def _deliver(self, seq: int, payload, writer: asyncio.StreamWriter):
+        """按序号交付帧：乱序帧暂存（缓存满时等待），连续的帧依次写入本地连接"""
+        if seq < self._next_seq or seq in self._reorder:
+            raise ValueError(f'Duplicate stripe frame: {seq}')
+
+        # 各通道内序号递增，缺失的帧必然位于某条未阻塞通道的队首，因此等待不会死锁
+        while seq != self._next_seq and self._reorder_bytes >= self.reorder_limit:
+            self._drained.clear()
+            await self._drained.wait()
+
+        if seq != self._next_seq:
+            self._reorder[seq] = payload
+            self._reorder_bytes += len(payload)
+            if self._reorder_bytes > self.reorder_peak:
+                self.reorder_peak = self._reorder_bytes
+            return
+
+        while True:
+            if not payload:
+                self._inbound_eof = True
+                break
+            writer.write(payload)
+            self._next_seq += 1
+            payload = self._reorder.pop(self._next_seq, None)
+            if payload is None:
+                break
+            self._reorder_bytes -= len(payload)
+        self._drained.set()
+        if self._inbound_eof:
+            # 让阻塞在 recv 之外的其它接收任务结束
+            return
+        await writer.drain()
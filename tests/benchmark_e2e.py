@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端基准测试
+在本机启动 Echo 服务器、插件服务端和插件客户端，按并发数、消息大小和时长施加负载，
+输出吞吐量、建连速率、往返延迟分位数与每 GB 数据的 CPU 耗时（JSON）
+
+    本脚本 -> 插件客户端 -> WebSocket -> 插件服务端 -> Echo 服务器
+
+三个进程分别由 start_echo_server.py、start_plugin_server.py、start_plugin_client.py 启动。
+
+负载类型：
+    rtt     每个连接循环发送 size 字节并等待回显，统计往返延迟与吞吐量
+    bulk    每个连接持续双向传输（64KB 写入），统计吞吐量
+    connect 每个并发槽循环「建连 -> 一次 size 字节往返 -> 关闭」，统计每秒连接数
+
+字节数按负载发出的载荷计（回显的同等数据不重复计入），MB = 2^20 字节，GB = 2^30 字节。
+CPU 耗时读取 /proc/<pid>/stat（仅 Linux，其他平台为 null）。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+from benchmark_fast_path import wait_port
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+
+WORKLOADS = ('rtt', 'bulk', 'connect')
+BULK_CHUNK = 64 * 1024
+SETTLE_INTERVAL = 0.25  # 两轮负载之间等待插件进程空闲（排空上一轮缓冲的数据）
+SETTLE_IDLE_CPU = 0.02  # 每个采样间隔内 CPU 时间低于该值视为空闲（秒）
+SETTLE_TIMEOUT = 30.0
+CONNECT_TIMEOUT = 30.0
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+
+def parse_int_list(value):
+    """解析逗号分隔的整数列表"""
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def raise_fd_limit():
+    """把文件描述符软限制提到硬限制（子进程继承），高并发时每个连接在各进程中各占 1～2 个描述符"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def cpu_seconds(pid):
+    """读取进程累计 CPU 时间（用户态 + 内核态，秒）；不支持时返回 None"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    # 去掉 pid 和 comm 后，utime/stime 分别是第 12、13 个字段
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def percentiles(samples):
+    """返回 p50/p99/p999（毫秒）"""
+    if not samples:
+        return {'p50': None, 'p99': None, 'p999': None}
+    samples.sort()
+    last = len(samples) - 1
+    return {name: round(samples[min(last, int(len(samples) * q))] * 1000, 3)
+            for name, q in (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))}
+
+
+def git_revision():
+    """当前提交（用于区分不同版本的结果）"""
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class PluginPair:
+    """Echo 服务器与插件服务端/客户端三个子进程"""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes = {}
+
+    def start(self):
+        args = self.args
+        tls = []
+        if args.tls:
+            tls = ['--cert', os.path.join(TESTS_DIR, 'fullchain.pem')]
+        commands = {
+            'echo': ['start_echo_server.py', '--host', '127.0.0.1', '--port', str(args.echo_port),
+                     '--quiet', '--buffer-size', str(BULK_CHUNK)],
+            'server': ['start_plugin_server.py', '--backend-host', '127.0.0.1',
+                       '--backend-port', str(args.echo_port), '--listen-host', '127.0.0.1',
+                       '--listen-port', str(args.ws_port)]
+                      + (tls + ['--key', os.path.join(TESTS_DIR, 'privkey.pem')] if tls else [])
+                      + ['--plugin-opts', ';'.join(filter(None, [args.plugin_opts, args.server_opts]))],
+            'client': ['start_plugin_client.py', '--remote-host', '127.0.0.1',
+                       '--remote-port', str(args.ws_port), '--local-host', '127.0.0.1',
+                       '--local-port', str(args.local_port)] + tls
+                      + ['--plugin-opts', ';'.join(filter(None, [args.plugin_opts, args.client_opts]))],
+        }
+        for name, command in commands.items():
+            # 输出丢弃；--verbose 时保留插件日志便于排查
+            output = None if args.verbose and name != 'echo' else subprocess.DEVNULL
+            self.processes[name] = subprocess.Popen(
+                [sys.executable, os.path.join(TESTS_DIR, command[0])] + command[1:],
+                stdout=output, stderr=output)
+
+    async def wait_ready(self):
+        for port in (self.args.echo_port, self.args.ws_port, self.args.local_port):
+            await wait_port('127.0.0.1', port)
+
+    def cpu(self):
+        """服务端与客户端进程的累计 CPU 时间"""
+        return {name: cpu_seconds(self.processes[name].pid) for name in ('server', 'client')}
+
+    async def settle(self):
+        """等待服务端和客户端进程空闲，避免上一轮残留的数据影响下一轮"""
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        before = self.cpu()
+        while time.monotonic() < deadline:
+            await asyncio.sleep(SETTLE_INTERVAL)
+            after = self.cpu()
+            if None in before.values() or all(after[name] - before[name] < SETTLE_IDLE_CPU for name in after):
+                return
+            before = after
+
+    def stop(self):
+        # 先停客户端（其优雅退出会等待活跃连接），再停服务端和 Echo
+        for name in ('client', 'server', 'echo'):
+            process = self.processes.get(name)
+            if process and process.poll() is None:
+                process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+class LoadGenerator:
+    """向插件客户端的本地端口施加负载"""
+
+    def __init__(self, port, connect_concurrency, cpu):
+        self.port = port
+        self.connect_limit = asyncio.Semaphore(connect_concurrency)
+        self.cpu = cpu  # 返回插件进程累计 CPU 时间的函数
+        self.errors = 0
+        self.cpu_start = None
+        self.process_start = None
+
+    def mark(self):
+        """测量开始：记录插件进程与本进程的 CPU 时间（建连与预热不计入）"""
+        self.cpu_start = self.cpu()
+        self.process_start = time.process_time()
+
+    async def open(self):
+        """建立一条连接（限制同时进行的建连数，避免监听队列溢出）"""
+        async with self.connect_limit:
+            return await asyncio.wait_for(asyncio.open_connection('127.0.0.1', self.port), CONNECT_TIMEOUT)
+
+    @staticmethod
+    def close(writer):
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+    async def open_many(self, count, message):
+        """建立 count 条连接并各做一次往返预热，返回成功的连接"""
+        async def one():
+            try:
+                reader, writer = await self.open()
+                writer.write(message)
+                await reader.readexactly(len(message))
+                return reader, writer
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                self.errors += 1
+                return None
+
+        return [conn for conn in await asyncio.gather(*(one() for _ in range(count))) if conn]
+
+    async def rtt(self, concurrency, size, duration):
+        message = os.urandom(size)
+        connections = await self.open_many(concurrency, message)
+        samples = []
+        self.mark()
+        deadline = time.perf_counter() + duration
+
+        async def loop(reader, writer):
+            try:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    writer.write(message)
+                    await reader.readexactly(size)
+                    samples.append(time.perf_counter() - start)
+            except (OSError, asyncio.IncompleteReadError):
+                self.errors += 1
+            finally:
+                self.close(writer)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(loop(reader, writer) for reader, writer in connections))
+        elapsed = time.perf_counter() - start
+        return {
+            'connections': len(connections),
+            'elapsed_s': elapsed,
+            'bytes': len(samples) * size,
+            'messages_per_s': round(len(samples) / elapsed, 1),
+            'rtt_ms': percentiles(samples),
+        }
+
+    async def bulk(self, concurrency, duration, warmup):
+        chunk = os.urandom(BULK_CHUNK)
+        connections = await self.open_many(concurrency, chunk[:1])
+        received = [0]
+        deadline = time.perf_counter() + warmup + duration
+
+        async def send(writer):
+            try:
+                while time.perf_counter() < deadline:
+                    writer.write(chunk)
+                    await writer.drain()
+            except OSError:
+                pass  # 接收端会记录错误
+
+        async def loop(reader, writer):
+            sender = asyncio.create_task(send(writer))
+            try:
+                while time.perf_counter() < deadline:
+                    data = await asyncio.wait_for(reader.read(BULK_CHUNK), max(0.01, deadline - time.perf_counter()))
+                    if not data:
+                        self.errors += 1
+                        break
+                    received[0] += len(data)
+            except asyncio.TimeoutError:
+                pass
+            except OSError:
+                self.errors += 1
+            finally:
+                sender.cancel()
+                self.close(writer)
+
+        async def measure():
+            # 预热期间各级缓冲逐渐填满，之后才开始计数
+            await asyncio.sleep(warmup)
+            received[0] = 0
+            self.mark()
+            return time.perf_counter()
+
+        results = await asyncio.gather(measure(), *(loop(reader, writer) for reader, writer in connections))
+        elapsed = time.perf_counter() - results[0]
+        return {'connections': len(connections), 'elapsed_s': elapsed, 'bytes': received[0]}
+
+    async def connect(self, concurrency, size, duration):
+        message = os.urandom(size)
+        samples = []
+        self.mark()
+        deadline = time.perf_counter() + duration
+
+        async def loop():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    reader, writer = await self.open()
+                except (OSError, asyncio.TimeoutError):
+                    self.errors += 1
+                    continue
+                try:
+                    writer.write(message)
+                    await reader.readexactly(size)
+                    samples.append(time.perf_counter() - start)
+                except (OSError, asyncio.IncompleteReadError):
+                    self.errors += 1
+                finally:
+                    self.close(writer)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return {
+            'connections': len(samples),
+            'elapsed_s': elapsed,
+            'bytes': len(samples) * size,
+            'connections_per_s': round(len(samples) / elapsed, 1),
+            'rtt_ms': percentiles(samples),  # 建连 + 首次往返
+        }
+
+
+def plan(args):
+    """展开负载矩阵：(负载类型, 并发数, 消息大小)"""
+    for workload in args.workloads:
+        for concurrency in args.concurrency:
+            if workload == 'bulk':
+                yield workload, concurrency, None
+            else:
+                for size in args.sizes:
+                    yield workload, concurrency, size
+
+
+def summarize(workload, concurrency, size, result, cpu_before, cpu_after, generator_cpu):
+    """合并单轮结果与 CPU 统计"""
+    elapsed = result.pop('elapsed_s')
+    cpu = {name: (None if cpu_before[name] is None else round(cpu_after[name] - cpu_before[name], 3))
+           for name in cpu_before}
+    cpu['generator'] = round(generator_cpu, 3)
+    plugin_cpu = None if None in (cpu['server'], cpu['client']) else cpu['server'] + cpu['client']
+    entry = {'workload': workload, 'concurrency': concurrency, 'size': size,
+             'duration_s': round(elapsed, 3), **result,
+             'mb_per_s': round(result['bytes'] / elapsed / MB, 2), 'cpu_s': cpu}
+    if plugin_cpu is not None and result['bytes']:
+        entry['cpu_s_per_gb'] = round(plugin_cpu / (result['bytes'] / GB), 3)
+    if workload == 'connect' and plugin_cpu is not None and result['connections']:
+        entry['cpu_ms_per_connection'] = round(plugin_cpu * 1000 / result['connections'], 3)
+    return entry
+
+
+def describe(entry):
+    """单轮结果的一行摘要"""
+    rtt = entry.get('rtt_ms', {})
+    return (f"{entry['workload']:<8} c={entry['concurrency']:<6} size={entry['size'] or '-':<7} "
+            f"{entry['mb_per_s']:>9.2f} MB/s  "
+            f"{entry.get('connections_per_s', '-'):>8} conn/s  "
+            f"p50/p99/p999={rtt.get('p50')}/{rtt.get('p99')}/{rtt.get('p999')} ms  "
+            f"cpu/GB={entry.get('cpu_s_per_gb')}s  errors={entry['errors']}")
+
+
+async def run(args):
+    fd_limit = raise_fd_limit()
+    if max(args.concurrency) * 2 + 64 > fd_limit:
+        print(f'Warning: concurrency {max(args.concurrency)} may exceed the fd limit ({fd_limit})', file=sys.stderr)
+
+    pair = PluginPair(args)
+    pair.start()
+    results = []
+    try:
+        await pair.wait_ready()
+        await pair.settle()
+        for workload, concurrency, size in plan(args):
+            generator = LoadGenerator(args.local_port, args.connect_concurrency, pair.cpu)
+            if workload == 'rtt':
+                result = await generator.rtt(concurrency, size, args.duration)
+            elif workload == 'bulk':
+                result = await generator.bulk(concurrency, args.duration, args.warmup)
+            else:
+                result = await generator.connect(concurrency, size, args.duration)
+            result['errors'] = generator.errors
+            entry = summarize(workload, concurrency, size, result, generator.cpu_start, pair.cpu(),
+                              time.process_time() - generator.process_start)
+            results.append(entry)
+            print(describe(entry), file=sys.stderr)
+            await pair.settle()
+    finally:
+        pair.stop()
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'tls': args.tls,
+            'server_opts': ';'.join(filter(None, [args.plugin_opts, args.server_opts])),
+            'client_opts': ';'.join(filter(None, [args.plugin_opts, args.client_opts])),
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'connect_concurrency': args.connect_concurrency,
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark for WSS Plugin')
+    parser.add_argument('--workloads', default=','.join(WORKLOADS),
+                        help=f'Comma-separated workloads to run (default: {",".join(WORKLOADS)})')
+    parser.add_argument('--concurrency', type=parse_int_list, default=[1, 64],
+                        help='Comma-separated connection counts, 1-10000 (default: 1,64)')
+    parser.add_argument('--sizes', type=parse_int_list, default=[64, 16384],
+                        help='Comma-separated message sizes for rtt/connect (default: 64,16384)')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per run (default: 5)')
+    parser.add_argument('--warmup', type=float, default=2.0,
+                        help='Seconds of bulk transfer before counting bytes (default: 2)')
+    parser.add_argument('--connect-concurrency', type=int, default=256,
+                        help='Max connection attempts in flight (default: 256)')
+    parser.add_argument('--tls', action='store_true', help='Use WSS with tests/fullchain.pem and privkey.pem')
+    parser.add_argument('--plugin-opts', default='', help='Extra SS_PLUGIN_OPTIONS for both plugins')
+    parser.add_argument('--server-opts', default='', help='Extra SS_PLUGIN_OPTIONS for the server only')
+    parser.add_argument('--client-opts', default='', help='Extra SS_PLUGIN_OPTIONS for the client only')
+    parser.add_argument('--output', default=None, help='Write JSON results to this file (default: stdout)')
+    parser.add_argument('--verbose', action='store_true', help='Show plugin logs')
+    parser.add_argument('--echo-port', type=int, default=38388)
+    parser.add_argument('--ws-port', type=int, default=38443)
+    parser.add_argument('--local-port', type=int, default=31080)
+    args = parser.parse_args()
+
+    args.workloads = [w.strip() for w in args.workloads.split(',') if w.strip()]
+    for workload in args.workloads:
+        if workload not in WORKLOADS:
+            parser.error(f'Unknown workload: {workload}')
+    if not args.concurrency or min(args.concurrency) < 1 or max(args.concurrency) > 10000:
+        parser.error('--concurrency must be between 1 and 10000')
+    if not args.sizes or min(args.sizes) < 1:
+        parser.error('--sizes must be positive')
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f'Results written to {args.output}', file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
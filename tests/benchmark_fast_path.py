@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快速路径基准测试
+对比默认配置与 uvloop/TCP_NODELAY/套接字缓冲区调优后的吞吐量与 p99 延迟
+
+回显服务器、插件服务端和插件客户端分别运行在独立进程中：
+    回显服务器 <- 插件服务端 <- WebSocket <- 插件客户端 <- 本脚本
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+
+# 两组对比配置（客户端和服务端使用相同选项）
+PROFILES = [
+    ('default', ''),
+    ('fast-path', 'uvloop=true;nodelay=true;sndbuf=1048576;rcvbuf=1048576;keepalive=60'),
+]
+
+
+def run_role(role):
+    """子进程入口：运行插件服务端或客户端（daemon 模式）"""
+    sys.path.insert(0, ROOT_DIR)
+    if role == 'server':
+        import wss_plugin_server
+        wss_plugin_server.run()
+    else:
+        import wss_plugin_client
+        wss_plugin_client.run()
+
+
+def spawn(args, env):
+    """启动子进程（输出丢弃）"""
+    return subprocess.Popen([sys.executable] + args, env={**os.environ, **env},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_port(host, port, timeout=10.0):
+    """等待端口可连接"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def measure_throughput(port, connections, size):
+    """每个连接发送 size 字节并读回，返回总吞吐量（MB/s，按单向计）"""
+    payload = os.urandom(size)
+
+    async def one():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        async def send():
+            chunk = 64 * 1024
+            for offset in range(0, size, chunk):
+                writer.write(payload[offset:offset + chunk])
+                await writer.drain()
+
+        sender = asyncio.create_task(send())
+        received = await reader.readexactly(size)
+        await sender
+        writer.close()
+        if received != payload:
+            raise RuntimeError('Echo data mismatch')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    return connections * size / elapsed / (1024 * 1024)
+
+
+async def measure_latency(port, connections, rounds, message_size):
+    """多个连接并发做小包往返，返回 (p50, p99) 往返时间（毫秒）"""
+    message = os.urandom(message_size)
+    samples = []
+
+    async def one():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        # 预热：跳过连接建立后的首次往返
+        writer.write(message)
+        await reader.readexactly(message_size)
+        for _ in range(rounds):
+            start = time.perf_counter()
+            writer.write(message)
+            await reader.readexactly(message_size)
+            samples.append((time.perf_counter() - start) * 1000)
+        writer.close()
+
+    await asyncio.gather(*(one() for _ in range(connections)))
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+async def run_profile(name, options, args):
+    """在一组选项下启动三个进程并测量"""
+    env_server = {
+        'SS_REMOTE_HOST': '127.0.0.1', 'SS_REMOTE_PORT': str(args.ws_port),
+        'SS_LOCAL_HOST': '127.0.0.1', 'SS_LOCAL_PORT': str(args.echo_port),
+        'SS_PLUGIN_OPTIONS': options,
+    }
+    env_client = {
+        'SS_REMOTE_HOST': '127.0.0.1', 'SS_REMOTE_PORT': str(args.ws_port),
+        'SS_LOCAL_HOST': '127.0.0.1', 'SS_LOCAL_PORT': str(args.local_port),
+        'SS_PLUGIN_OPTIONS': options,
+    }
+    processes = [
+        spawn([os.path.join(TESTS_DIR, 'start_echo_server.py'), '--host', '127.0.0.1',
+               '--port', str(args.echo_port)], {}),
+        spawn([os.path.abspath(__file__), '--role', 'server'], env_server),
+        spawn([os.path.abspath(__file__), '--role', 'client'], env_client),
+    ]
+    try:
+        for port in (args.echo_port, args.ws_port, args.local_port):
+            await wait_port('127.0.0.1', port)
+        throughput = await measure_throughput(args.local_port, args.connections, args.size)
+        p50, p99 = await measure_latency(args.local_port, args.connections, args.rounds, args.message_size)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    print(f'{name:<12} {throughput:>10.1f} {p50:>10.3f} {p99:>10.3f}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Fast-path benchmark for WSS Plugin')
+    parser.add_argument('--role', choices=['server', 'client'], help=argparse.SUPPRESS)
+    parser.add_argument('--connections', type=int, default=8, help='Concurrent connections (default: 8)')
+    parser.add_argument('--size', type=int, default=16 * 1024 * 1024,
+                        help='Bytes echoed per connection in the throughput test (default: 16MB)')
+    parser.add_argument('--rounds', type=int, default=500, help='Round trips per connection (default: 500)')
+    parser.add_argument('--message-size', type=int, default=64, help='Latency test message size (default: 64)')
+    parser.add_argument('--echo-port', type=int, default=28388)
+    parser.add_argument('--ws-port', type=int, default=28443)
+    parser.add_argument('--local-port', type=int, default=21080)
+    args = parser.parse_args()
+
+    print(f'{"profile":<12} {"MB/s":>10} {"p50 ms":>10} {"p99 ms":>10}')
+    for name, options in PROFILES:
+        await run_profile(name, options, args)
+
+
+if __name__ == '__main__':
+    if '--role' in sys.argv:
+        run_role(sys.argv[sys.argv.index('--role') + 1])
+    else:
+        asyncio.run(main())
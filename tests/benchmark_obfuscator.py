@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+加扰编解码器微基准
+按载荷大小（1B～64KB）测量各编解码器 obfuscate / deobfuscate 及原地接口的 ops/s 与 MB/s，
+结果写入基线文件，后续运行与基线对比，吞吐量下降超过阈值时以非零状态退出
+
+最坏情况的去加扰（*_worst）：
+    legacy v1  载荷长度取 256n+255，偏移量为 255，需扫描全部 256 个候选偏移量
+    全部       每次去加扰前清空掩码缓存（纯 Python 实现每帧都重新计算整帧掩码）
+
+用法：
+    ./benchmark_obfuscator.py --update-baseline   # 在参考机器上生成/更新基线
+    ./benchmark_obfuscator.py                     # 与基线对比，回退超过 10% 时退出码为 1
+
+基线与机器相关，不随仓库提交：基线文件不存在时只输出测量结果并注明跳过回退检查（退出码 0）；
+基线存在但测量点没有对应条目时视为失败（--allow-missing 跳过这些点）。
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import obfuscator  # noqa: E402
+from obfuscator import FRAME_V1, MAX_SHORT_PAYLOAD, create_codec  # noqa: E402
+
+KEY = 'test_key_123'
+DEFAULT_BASELINE = os.path.join(TESTS_DIR, 'obfuscator_baseline.json')
+DEFAULT_THRESHOLD = 0.10  # 吞吐量下降超过 10% 视为回退
+
+# 载荷大小：1B 到 64KB（v1/v2 的长度字段为 2 字节，上限 65535）
+SIZES = (1, 16, 64, 256, 1024, 4096, 16384, MAX_SHORT_PAYLOAD)
+
+# 名称 -> (编解码器名, 构造参数)
+CODEC_CASES = {
+    'legacy-v1': ('legacy', {'version': 1}),
+    'legacy-v2': ('legacy', {'version': 2}),
+    'legacy-v3': ('legacy', {'version': 3}),
+    'xorstream': ('xorstream', {}),
+    'stream': ('stream', {}),
+}
+
+OPERATIONS = ('obfuscate', 'obfuscate_into', 'deobfuscate', 'deobfuscate_inplace',
+              'deobfuscate_worst', 'deobfuscate_inplace_worst')
+
+BATCH_BYTES = 4 * 1024 * 1024  # 每批预先生成的帧总大小上限
+BATCH_FRAMES = 256
+
+
+def git_revision():
+    """当前提交（用于区分不同版本的结果）"""
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def worst_case_sizes(case, size):
+    """
+    最坏情况使用的载荷长度候选（按优先顺序）
+
+    legacy v1 取 size 所在的 256n+255，依次向下；部分长度的长度字段会先匹配到错误的偏移量
+    （v1 格式本身的歧义），由调用方跳过无法还原的长度。
+    """
+    if CODEC_CASES[case][1].get('version') != FRAME_V1:
+        return [size]
+    worst = min(size | 0xFF, MAX_SHORT_PAYLOAD)
+    return list(range(worst, 0, -256))
+
+
+class CodecBench:
+    """单个编解码器配置的测量（加扰端与去加扰端使用独立实例，有状态编解码器按帧序解码）"""
+
+    def __init__(self, case, backend):
+        name, options = CODEC_CASES[case]
+        self.encoder = create_codec(name, KEY, **options)
+        self.decoder = create_codec(name, KEY, **options)
+        if backend == 'python':
+            self.encoder._speedups = None
+            self.decoder._speedups = None
+        self._frames = None  # 无状态编解码器的帧可在各批之间复用
+
+    def clear_mask_cache(self):
+        """清空去加扰端的掩码缓存"""
+        for cache in ('_mask_cache', '_frame_mask_cache'):
+            getattr(self.decoder, cache, {}).clear()
+
+    def frames(self, data, count):
+        """按顺序生成 count 个加扰帧（不计时）；有状态编解码器每批重新生成以保持帧序"""
+        if self._frames is None or getattr(self.encoder, 'stateful', False):
+            self._frames = [self.encoder.obfuscate(data) for _ in range(count)]
+        return self._frames
+
+    def batch(self, op, data, count):
+        """执行一批操作，返回耗时（秒）"""
+        if op == 'obfuscate':
+            obfuscate = self.encoder.obfuscate
+            start = time.perf_counter()
+            for _ in range(count):
+                obfuscate(data)
+            return time.perf_counter() - start
+
+        if op == 'obfuscate_into':
+            obfuscate_into = self.encoder.obfuscate_into
+            buffer = bytearray(self.encoder.max_frame_size(len(data)))
+            start = time.perf_counter()
+            for _ in range(count):
+                obfuscate_into(data, buffer)
+            return time.perf_counter() - start
+
+        frames = self.frames(data, count)
+        worst = op.endswith('_worst')
+        if op.startswith('deobfuscate_inplace'):
+            decode = self.decoder.deobfuscate_inplace
+            frames = [bytearray(frame) for frame in frames]
+        else:
+            decode = self.decoder.deobfuscate
+        clear = self.clear_mask_cache
+        start = time.perf_counter()
+        if worst:
+            for frame in frames:
+                clear()
+                decode(frame)
+        else:
+            for frame in frames:
+                decode(frame)
+        return time.perf_counter() - start
+
+    def verify(self, op, data):
+        """确认该操作能正确还原数据（legacy v1 的偏移量推导存在歧义，个别长度无法还原）"""
+        if not op.startswith('deobfuscate'):
+            return True
+        frame = self.encoder.obfuscate(data)
+        if 'inplace' in op:
+            return bytes(self.decoder.deobfuscate_inplace(bytearray(frame))) == data
+        return self.decoder.deobfuscate(frame) == data
+
+
+def measure(bench, op, data, duration, repeat):
+    """按批执行直到累计耗时达到 duration，重复 repeat 次取最快一次的 ops/s"""
+    count = max(1, min(BATCH_FRAMES, BATCH_BYTES // max(1, len(data))))
+    best = 0.0
+    for _ in range(repeat):
+        elapsed = 0.0
+        ops = 0
+        while elapsed < duration:
+            elapsed += bench.batch(op, data, count)
+            ops += count
+        best = max(best, ops / elapsed)
+    return best
+
+
+def result_key(backend, case, op, size):
+    return f'{backend}/{case}/{op}/{size}'
+
+
+def run(args):
+    backend = args.backend
+    if backend == 'auto':
+        backend = 'c' if obfuscator._speedups is not None else 'python'
+    elif backend == 'c' and obfuscator._speedups is None:
+        raise SystemExit('C speedups not built (python3 build_speedups.py)')
+
+    results = {}
+    print(f"{'codec':<10} {'operation':<26} {'size':>6} {'payload':>7} {'ops/s':>12} {'MB/s':>10}",
+          file=sys.stderr)
+    for case in args.codecs:
+        for op in args.operations:
+            for size in args.sizes:
+                # 每个测量点使用新实例，避免前一项的缓存与流状态影响结果
+                bench = CodecBench(case, backend)
+                if op.endswith('_worst'):
+                    for payload in worst_case_sizes(case, size):
+                        data = os.urandom(payload)
+                        if bench.verify(op, data):
+                            break
+                    else:
+                        raise RuntimeError(f'{case} {op}: no payload near {size} bytes round-trips')
+                    ambiguous = False
+                else:
+                    payload = size
+                    data = os.urandom(payload)
+                    ambiguous = not bench.verify(op, data)
+                ops_per_s = measure(bench, op, data, args.duration, args.repeat)
+                entry = {'ops_per_s': round(ops_per_s, 1), 'mb_per_s': round(ops_per_s * payload / 1e6, 3),
+                         'payload': payload}
+                if ambiguous:
+                    # 帧被解到错误的偏移量：耗时仍计入，但不代表正常去加扰
+                    entry['ambiguous'] = True
+                results[result_key(backend, case, op, size)] = entry
+                print(f'{case:<10} {op:<26} {size:>6} {payload:>7} {ops_per_s:>12.1f} {entry["mb_per_s"]:>10.2f}'
+                      + ('  (ambiguous offset)' if ambiguous else ''), file=sys.stderr)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'duration_s': args.duration,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    与基线对比
+
+    Returns:
+        (回退项列表 [(键, 基线 MB/s, 当前 MB/s, 变化比例)], 基线中没有对应条目的键列表)
+    """
+    regressions = []
+    missing = []
+    for key, entry in report['results'].items():
+        base = baseline.get('results', {}).get(key)
+        if not base or not base.get('mb_per_s'):
+            missing.append(key)
+            continue
+        change = entry['mb_per_s'] / base['mb_per_s'] - 1
+        if change < -threshold:
+            regressions.append((key, base['mb_per_s'], entry['mb_per_s'], change))
+    return regressions, missing
+
+
+def update_baseline(path, report):
+    """写入基线：保留文件中其他后端/配置的条目，覆盖本次测量的条目"""
+    baseline = {'results': {}}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)
+    baseline['meta'] = report['meta']
+    baseline.setdefault('results', {}).update(report['results'])
+    baseline['results'] = dict(sorted(baseline['results'].items()))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2)
+        f.write('\n')
+
+
+def parse_list(choices):
+    """解析逗号分隔的列表并校验取值"""
+    def parse(value):
+        items = [item.strip() for item in value.split(',') if item.strip()]
+        for item in items:
+            if item not in choices:
+                raise argparse.ArgumentTypeError(f'invalid choice: {item} (choose from {", ".join(choices)})')
+        return items
+    return parse
+
+
+def parse_sizes(value):
+    sizes = [int(item) for item in value.split(',') if item.strip()]
+    if not sizes or min(sizes) < 1 or max(sizes) > MAX_SHORT_PAYLOAD:
+        raise argparse.ArgumentTypeError(f'sizes must be between 1 and {MAX_SHORT_PAYLOAD}')
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Obfuscator micro-benchmark with regression check')
+    parser.add_argument('--codecs', type=parse_list(tuple(CODEC_CASES)), default=list(CODEC_CASES),
+                        help=f'Comma-separated codecs (default: {",".join(CODEC_CASES)})')
+    parser.add_argument('--operations', type=parse_list(OPERATIONS), default=list(OPERATIONS),
+                        help='Comma-separated operations (default: all)')
+    parser.add_argument('--sizes', type=parse_sizes, default=list(SIZES),
+                        help=f'Comma-separated payload sizes (default: {",".join(map(str, SIZES))})')
+    parser.add_argument('--backend', choices=('auto', 'python', 'c'), default='auto',
+                        help='Implementation to measure (default: C speedups if built)')
+    parser.add_argument('--duration', type=float, default=0.1, help='Seconds per measurement (default: 0.1)')
+    parser.add_argument('--repeat', type=int, default=3, help='Measurements per point, best is kept (default: 3)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline file (default: tests/obfuscator_baseline.json)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Fail when MB/s drops by more than this fraction (default: 0.10)')
+    parser.add_argument('--update-baseline', action='store_true', help='Write results into the baseline file')
+    parser.add_argument('--allow-missing', action='store_true',
+                        help='Do not fail when measured points have no baseline entry')
+    parser.add_argument('--output', default=None, help='Also write this run as JSON')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+    if args.update_baseline:
+        update_baseline(args.baseline, report)
+        print(f'Baseline updated: {args.baseline}', file=sys.stderr)
+        return 0
+
+    # 基线按机器生成、不随仓库提交；没有基线时只输出测量结果，明确跳过回退检查
+    if not os.path.exists(args.baseline):
+        print(f'\nNo baseline at {args.baseline}: regression check SKIPPED '
+              f'(run with --update-baseline on the reference machine)', file=sys.stderr)
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions, missing = compare(report, baseline, args.threshold)
+    failed = False
+    if missing:
+        print(f'\n{len(missing)} results have no baseline entry (run with --update-baseline):', file=sys.stderr)
+        for key in missing:
+            print(f'  {key}', file=sys.stderr)
+        failed = not args.allow_missing
+    if regressions:
+        print(f'\n{len(regressions)} regressions beyond {args.threshold:.0%}:', file=sys.stderr)
+        for key, base, current, change in regressions:
+            print(f'  {key}: {base:.2f} -> {current:.2f} MB/s ({change:+.1%})', file=sys.stderr)
+        failed = True
+    if failed:
+        return 1
+    print(f'\nNo regressions beyond {args.threshold:.0%} against {args.baseline} '
+          f'({len(report["results"]) - len(missing)} points compared)', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
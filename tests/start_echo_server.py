@@ -12,9 +12,11 @@ import signal
 class EchoServer:
     """Echo 服务器 - 将接收到的数据原样返回"""
     
-    def __init__(self, host='127.0.0.1', port=8388):
+    def __init__(self, host='127.0.0.1', port=8388, quiet=False, buffer_size=8192):
         self.host = host
         self.port = port
+        self.quiet = quiet  # 不输出每个连接/每次读写的日志（基准测试用）
+        self.buffer_size = buffer_size
         self.server = None
         self.client_count = 0
         
@@ -23,23 +25,27 @@ class EchoServer:
         self.client_count += 1
         client_id = self.client_count
         addr = writer.get_extra_info('peername')
+        verbose = not self.quiet
         
-        print(f'[Client {client_id}] Connected from {addr}')
+        if verbose:
+            print(f'[Client {client_id}] Connected from {addr}')
         
+        total_bytes = 0
         try:
-            total_bytes = 0
             while True:
-                data = await reader.read(8192)
+                data = await reader.read(self.buffer_size)
                 if not data:
                     break
                 
                 total_bytes += len(data)
-                print(f'[Client {client_id}] Received {len(data)} bytes (total: {total_bytes})')
+                if verbose:
+                    print(f'[Client {client_id}] Received {len(data)} bytes (total: {total_bytes})')
                 
                 # 回显数据
                 writer.write(data)
                 await writer.drain()
-                print(f'[Client {client_id}] Echoed {len(data)} bytes')
+                if verbose:
+                    print(f'[Client {client_id}] Echoed {len(data)} bytes')
                 
         except asyncio.CancelledError:
             print(f'[Client {client_id}] Connection cancelled')
@@ -51,7 +57,8 @@ class EchoServer:
                 await writer.wait_closed()
             except:
                 pass
-            print(f'[Client {client_id}] Disconnected (total bytes: {total_bytes})')
+            if verbose:
+                print(f'[Client {client_id}] Disconnected (total bytes: {total_bytes})')
     
     async def start(self):
         """启动服务器"""
@@ -62,7 +69,8 @@ class EchoServer:
         self.server = await asyncio.start_server(
             self.handle_client,
             self.host,
-            self.port
+            self.port,
+            backlog=1024
         )
         
         addrs = ', '.join(str(sock.getsockname()) for sock in self.server.sockets)
@@ -80,10 +88,12 @@ async def main():
     parser = argparse.ArgumentParser(description='Test Echo Server for WSS Plugin')
     parser.add_argument('--host', default='127.0.0.1', help='Host to bind (default: 127.0.0.1)')
     parser.add_argument('--port', type=int, default=8388, help='Port to listen (default: 8388)')
+    parser.add_argument('--quiet', action='store_true', help='Do not log each connection and read')
+    parser.add_argument('--buffer-size', type=int, default=8192, help='Read size per echo (default: 8192)')
     
     args = parser.parse_args()
     
-    server = EchoServer(args.host, args.port)
+    server = EchoServer(args.host, args.port, args.quiet, args.buffer_size)
     
     # 处理 Ctrl+C
     def signal_handler(sig, frame):
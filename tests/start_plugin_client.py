@@ -10,7 +10,7 @@ import sys
 
 def start_client(remote_host='127.0.0.1', remote_port=8443,
                 local_host='127.0.0.1', local_port=1080,
-                cert_file=None, debug=False, log_file=None):
+                cert_file=None, debug=False, log_file=None, plugin_opts=None):
     """
     启动 WSS Plugin 客户端
     
@@ -22,6 +22,7 @@ def start_client(remote_host='127.0.0.1', remote_port=8443,
         cert_file: SSL 证书文件（可选，用于验证服务器证书）
         debug: 启用调试日志
         log_file: 日志文件路径
+        plugin_opts: 追加到 SS_PLUGIN_OPTIONS 的其他选项（如 'uvloop=true;mux=4'）
     """
     # Convert cert_file to absolute path if provided
     if cert_file is not None:
@@ -41,6 +42,8 @@ def start_client(remote_host='127.0.0.1', remote_port=8443,
         plugin_options.append('debug=true')
     if log_file:
         plugin_options.append(f'log_file={os.path.abspath(log_file)}')
+    if plugin_opts:
+        plugin_options.append(plugin_opts)
     
     os.environ['SS_PLUGIN_OPTIONS'] = ';'.join(plugin_options)
     
@@ -74,8 +77,8 @@ def start_client(remote_host='127.0.0.1', remote_port=8443,
         client_module = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(client_module)
         
-        # 运行客户端
-        asyncio.run(client_module.main())
+        # 运行客户端（按插件选项选择事件循环）
+        client_module.run()
         
     except KeyboardInterrupt:
         print('\n\nWSS Plugin Client stopped by user')
@@ -106,6 +109,8 @@ def main():
                        help='Enable debug logging')
     parser.add_argument('--log-file', default=None,
                        help='Log file path (optional)')
+    parser.add_argument('--plugin-opts', default=None,
+                       help="Extra SS_PLUGIN_OPTIONS, e.g. 'uvloop=true;mux=4' (optional)")
     
     args = parser.parse_args()
     
@@ -116,7 +121,8 @@ def main():
         args.local_port,
         args.cert,
         args.debug,
-        args.log_file
+        args.log_file,
+        args.plugin_opts
     )
 
 
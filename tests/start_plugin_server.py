@@ -11,7 +11,7 @@ import sys
 def start_server(backend_host='127.0.0.1', backend_port=8388,
                 listen_host='0.0.0.0', listen_port=8443,
                 cert_file=None, key_file=None,
-                debug=False, log_file=None):
+                debug=False, log_file=None, plugin_opts=None):
     """
     启动 WSS Plugin 服务端
     
@@ -24,6 +24,7 @@ def start_server(backend_host='127.0.0.1', backend_port=8388,
         key_file: SSL 私钥文件
         debug: 启用调试日志
         log_file: 日志文件路径
+        plugin_opts: 追加到 SS_PLUGIN_OPTIONS 的其他选项（如 'uvloop=true;mux=4'）
     """
     if cert_file is not None:
         cert_file = os.path.abspath(cert_file)
@@ -41,6 +42,8 @@ def start_server(backend_host='127.0.0.1', backend_port=8388,
         plugin_options_list.append('debug=true')
     if log_file:
         plugin_options_list.append(f'log_file={os.path.abspath(log_file)}')
+    if plugin_opts:
+        plugin_options_list.append(plugin_opts)
     
     plugin_options = ';'.join(plugin_options_list)
     
@@ -80,10 +83,12 @@ def start_server(backend_host='127.0.0.1', backend_port=8388,
             os.path.join(parent_dir, "wss_plugin_server.py")
         )
         server_module = importlib.util.module_from_spec(spec)
+        # 先注册到 sys.modules：workers>1 时 spawn 需要按模块名序列化 worker_main
+        sys.modules[spec.name] = server_module
         spec.loader.exec_module(server_module)
         
-        # 运行服务器
-        asyncio.run(server_module.main())
+        # 运行服务器（按插件选项选择事件循环）
+        server_module.run()
         
     except KeyboardInterrupt:
         print('\n\nWSS Plugin Server stopped by user')
@@ -116,6 +121,8 @@ def main():
                        help='Enable debug logging')
     parser.add_argument('--log-file', default=None,
                        help='Log file path (optional)')
+    parser.add_argument('--plugin-opts', default=None,
+                       help="Extra SS_PLUGIN_OPTIONS, e.g. 'uvloop=true;mux=4' (optional)")
     
     args = parser.parse_args()
     
@@ -127,7 +134,8 @@ def main():
         args.cert,
         args.key,
         args.debug,
-        args.log_file
+        args.log_file,
+        args.plugin_opts
     )
 
 
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志模块
+热路径安全的日志设施：后台线程输出、错误日志限频与逐帧采样跟踪
+
+- 日志记录经 QueueHandler 放入队列，由 QueueListener 线程写控制台和 log_file，文件 I/O 不阻塞事件循环
+- 调用方使用 %-格式的惰性参数，级别未开启时不格式化字符串
+- 同一条错误模板在窗口内超过上限后只计数，避免故障时日志刷屏
+- 逐帧跟踪只在 DEBUG 开启时生效，且每 N 帧输出 1 条
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
+from typing import Optional
+
+# 日志格式
+CFG_LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 同一条错误模板的限频窗口（秒）与窗口内最多输出条数
+CFG_ERROR_LOG_INTERVAL = 10
+CFG_ERROR_LOG_BURST = 5
+
+# DEBUG 级别下逐帧跟踪的默认采样间隔（每 N 帧输出 1 条，1 为每帧都输出）
+CFG_TRACE_SAMPLE_EVERY = 100
+
+# 插件相关的日志器（debug 时一并设为 DEBUG）
+PLUGIN_LOGGERS = ('ssl', 'websockets', 'wss-plugin-server', 'wss-plugin-client')
+
+_listener = None
+
+
+def _stop_listener():
+    """停止后台日志线程并输出队列中剩余的记录"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging(debug=False, log_file=None):
+    """配置日志系统：处理器在后台线程中运行，事件循环只负责入队"""
+    global _listener
+    log_level = logging.DEBUG if debug else logging.INFO
+
+    handlers = []
+
+    # 控制台输出
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(CFG_LOG_FORMAT))
+    handlers.append(console_handler)
+
+    # 文件输出（如果指定）
+    if log_file:
+        file_handler = logging.FileHandler(log_file, mode='a', encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter(CFG_LOG_FORMAT))
+        handlers.append(file_handler)
+
+    # 重新配置时先停止旧的后台线程
+    if _listener is None:
+        atexit.register(_stop_listener)
+    else:
+        _stop_listener()
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+
+    # 入队前只合并消息参数（含异常堆栈），完整格式由后台线程中的处理器负责
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    # 配置根日志
+    logging.basicConfig(
+        level=log_level,
+        handlers=[queue_handler],
+        force=True
+    )
+
+    # 配置 SSL、websockets 和插件日志
+    for name in PLUGIN_LOGGERS:
+        logging.getLogger(name).setLevel(log_level)
+
+
+class RateLimitedLog:
+    """
+    按消息模板限频的日志
+
+    每个模板在 interval 秒内最多输出 burst 条，超出的只计数；
+    下一个窗口的第一条日志附带上一窗口被抑制的条数。
+    """
+
+    def __init__(self, log: logging.Logger, interval: float = CFG_ERROR_LOG_INTERVAL,
+                 burst: int = CFG_ERROR_LOG_BURST):
+        self.log = log
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}  # 模板 -> [窗口起点, 已输出条数, 被抑制条数]
+
+    def emit(self, level: int, msg: str, *args):
+        """按限频规则输出一条日志（msg 为 %-格式模板，同时作为限频的类别）"""
+        if not self.log.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        window = self._windows.get(msg)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            window = self._windows[msg] = [now, 0, 0]
+            if suppressed:
+                msg += ' (%d similar messages suppressed)'
+                args += (suppressed,)
+        if window[1] >= self.burst:
+            window[2] += 1
+            return
+        window[1] += 1
+        self.log.log(level, msg, *args)
+
+    def error(self, msg: str, *args):
+        self.emit(logging.ERROR, msg, *args)
+
+    def warning(self, msg: str, *args):
+        self.emit(logging.WARNING, msg, *args)
+
+
+class FrameTrace:
+    """单个连接方向的逐帧采样计数：sample() 在第 1、N+1、2N+1... 帧返回 True"""
+
+    __slots__ = ('every', 'count')
+
+    def __init__(self, every: int):
+        self.every = max(1, every)
+        self.count = 0
+
+    def sample(self) -> bool:
+        count = self.count
+        self.count = count + 1
+        return count % self.every == 0
+
+
+def frame_trace(log: logging.Logger, every: int = CFG_TRACE_SAMPLE_EVERY) -> Optional[FrameTrace]:
+    """
+    为一个连接方向创建逐帧跟踪采样器
+
+    DEBUG 未开启时返回 None，热路径只需 `if trace and trace.sample():` 一次判空。
+    """
+    if not log.isEnabledFor(logging.DEBUG):
+        return None
+    return FrameTrace(every)
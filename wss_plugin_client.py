@@ -11,61 +11,90 @@ import sys
 import ssl
 import logging
 import struct
+import time
 import pathlib
 from typing import Optional
 
 # 配置常量
-CFG_PRE_CONNECTION = True  # True: per-connection mode (for ss-libev), False: daemon mode (standalone)
+CFG_READ_BUF_SIZE = 64 * 1024  # 64KB（单次读取上限，不超过所协商帧格式的 max_payload）
+CFG_POOL_PING_TIMEOUT = 5  # 连接池巡检 ping 的超时（秒）
+CFG_DEFAULT_MODE = 'daemon'  # 默认运行模式，可由插件选项 mode 覆盖
+CFG_SHUTDOWN_GRACE = 5  # 收到 SIGTERM/SIGINT 后等待活跃连接结束的时间（秒）
+CFG_LISTEN_BACKLOG = 1024  # 本地监听队列长度
+
+# 运行模式：daemon 单进程持续服务所有本地连接；per-connection 只桥接一个连接后退出（旧版 ss-libev 用法）
+RUN_MODES = ('daemon', 'per-connection')
 
 # 导入websockets库
 PATH_WEBSOCKETS = pathlib.Path(__file__).parent / "websockets" / "src"
 sys.path.insert(0, str(PATH_WEBSOCKETS))
 
 from websockets.asyncio.client import connect as ws_connect
+from websockets.protocol import State
+from websockets.exceptions import ConnectionClosedOK
 
 # 导入加扰模块
-from obfuscator import DataObfuscator
+from obfuscator import (
+    CODECS,
+    DEFAULT_CODEC,
+    FRAME_V1,
+    FRAME_V3,
+    SUPPORTED_FRAME_VERSIONS,
+    codec_from_subprotocol,
+    create_codec,
+    subprotocol_for_codec,
+)
+from mux import MUX_PATH_SUFFIX, MuxSession
+from pool import CFG_POOL_MAX_AGE, CFG_POOL_MAX_IDLE, ConnectionPool
+from striping import CFG_STRIPE_MAX_LANES, StripedFlow, new_flow_id, stripe_path
+from tracing import CFG_TRACE_SAMPLE_EVERY, RateLimitedLog, frame_trace, setup_logging
+from metrics import (
+    CFG_STAGE_REPORT_INTERVAL,
+    STAGE_DEOBFUSCATE,
+    STAGE_DRAIN,
+    STAGE_OBFUSCATE,
+    STAGE_READ_WAIT,
+    STAGE_RECV_WAIT,
+    STAGE_WS_SEND,
+    MeteredCodec,
+    MetricsRegistry,
+    StageTimings,
+    report_stage_timings,
+    start_metrics_server,
+)
+from offload import CFG_OFFLOAD_THRESHOLD, CodecOffload, pipeline_deobfuscator, pipeline_obfuscator
+from relay import (
+    CFG_ADAPTIVE_READ_MIN,
+    CFG_COALESCE_DELAY_MS,
+    CFG_PIPELINE_HIGH_WATER,
+    AdaptiveReadSize,
+    coalesce_reads,
+    install_uvloop,
+    run_pipeline,
+    stream_source,
+    tune_socket,
+    wait_for_shutdown,
+)
 
-def setup_logging(debug=False, log_file=None):
-    """配置日志系统"""
-    log_level = logging.DEBUG if debug else logging.INFO
-    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    
-    handlers = []
-    
-    # 控制台输出
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(log_format))
-    handlers.append(console_handler)
+logger = logging.getLogger('wss-plugin-client')
+error_log = RateLimitedLog(logger)  # 每连接错误日志的限频输出
+
+
+class SessionReuseContext(ssl.SSLContext):
+    """
+    复用 TLS 会话的客户端 SSLContext
     
-    # 文件输出（如果指定）
-    if log_file:
-        file_handler = logging.FileHandler(log_file, mode='a', encoding='utf-8')
-        file_handler.setFormatter(logging.Formatter(log_format))
-        handlers.append(file_handler)
+    asyncio 的 create_connection 不能传入 SSLSession，这里在 wrap_bio 时附加最近一次握手得到的会话
+    （TLS 1.3 会话票据或 TLS 1.2 会话 ID），服务端接受时以简短握手代替完整握手。
+    """
     
-    # 配置根日志
-    logging.basicConfig(
-        level=log_level,
-        format=log_format,
-        handlers=handlers,
-        force=True
-    )
+    session = None
     
-    # 配置 SSL、websockets 和插件日志
-    if debug:
-        logging.getLogger('ssl').setLevel(logging.DEBUG)
-        logging.getLogger('websockets').setLevel(logging.DEBUG)
-        logging.getLogger('wss-plugin-server').setLevel(logging.DEBUG)
-        logging.getLogger('wss-plugin-client').setLevel(logging.DEBUG)
-    else:
-        logging.getLogger('ssl').setLevel(logging.INFO)
-        logging.getLogger('websockets').setLevel(logging.INFO)
-        logging.getLogger('wss-plugin-server').setLevel(logging.INFO)
-        logging.getLogger('wss-plugin-client').setLevel(logging.INFO)
-
-
-logger = logging.getLogger('wss-plugin-client')
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.session
+        return super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                server_hostname=server_hostname, session=session)
 
 
 class WSSPluginClient:
@@ -87,6 +116,20 @@ class WSSPluginClient:
         log_file = self.plugin_opts.get('log_file', None)
         setup_logging(debug=debug, log_file=log_file)
         
+        # 运行模式：daemon（默认）在 SS_LOCAL 上监听并服务所有连接，per-connection 连接 SS_LOCAL 桥接单个连接
+        self.mode = self.plugin_opts.get('mode', CFG_DEFAULT_MODE)
+        if self.mode not in RUN_MODES:
+            raise ValueError(f'Unsupported mode: {self.mode}')
+        
+        # daemon 模式下正在处理的本地连接任务（退出时等待或取消）与连接统计
+        self.connection_tasks = set()
+        self.connections_total = 0
+        
+        # 逐帧跟踪（仅 DEBUG 级别）：每 trace_every 帧输出 1 条，1 为每帧都输出
+        self.trace_every = int(self.plugin_opts.get('trace_every', CFG_TRACE_SAMPLE_EVERY))
+        if self.trace_every < 1:
+            raise ValueError(f'Invalid trace_every: {self.trace_every}')
+        
         # 证书配置（可选）
         self.cert_file = self.plugin_opts.get('cert', None)
         
@@ -98,14 +141,118 @@ class WSSPluginClient:
         self.wss_port = self.ss_remote_port
         self.wss_path = '/ws'
         
-        # 数据加扰器 - 使用固定密钥
-        self.obfuscator = DataObfuscator('wss_plugin_default_key')
+        # 加扰编解码器（none/legacy/xorstream/stream），通过 WebSocket 子协议与服务端协商，
+        # 服务端不支持时回退到 legacy
+        self.obfs = self.plugin_opts.get('obfs', DEFAULT_CODEC)
+        if self.obfs not in CODECS:
+            raise ValueError(f'Unsupported obfs codec: {self.obfs}')
+        
+        # 编解码器的可协商参数（如 stream 的 pad_every），随子协议发送给服务端
+        self.obfs_options = {}
+        option = getattr(CODECS[self.obfs], 'negotiated_option', None)
+        if option and option in self.plugin_opts:
+            self.obfs_options[option] = int(self.plugin_opts[option])
+        
+        # legacy 帧格式版本上限（旧版服务端回退到 v1）
+        self.obfs_version = int(self.plugin_opts.get('obfs_version', FRAME_V3))
+        if self.obfs_version not in SUPPORTED_FRAME_VERSIONS:
+            raise ValueError(f'Unsupported obfs_version: {self.obfs_version}')
+        
+        # 单次读取的最大字节数（每帧承载的最大数据量），legacy v1/v2 帧不超过64KB
+        self.read_buf_size = int(self.plugin_opts.get('read_buf_size', CFG_READ_BUF_SIZE))
+        if self.read_buf_size <= 0:
+            raise ValueError(f'Invalid read_buf_size: {self.read_buf_size}')
+        
+        # 自适应读取大小：批量传输时逐步增大到 read_buf_size，交互式流量时缩小到 read_buf_min
+        self.adaptive_read = self.plugin_opts.get('adaptive_read', 'true').lower() in ('true', '1', 'yes')
+        self.read_buf_min = int(self.plugin_opts.get('read_buf_min', CFG_ADAPTIVE_READ_MIN))
+        if self.read_buf_min <= 0:
+            raise ValueError(f'Invalid read_buf_min: {self.read_buf_min}')
+        
+        # 写合并（默认关闭）：小读取在 coalesce_delay 毫秒内合并为一帧，合并后不超过 coalesce_max 字节
+        self.coalesce_delay = float(self.plugin_opts.get('coalesce_delay', CFG_COALESCE_DELAY_MS)) / 1000
+        if self.coalesce_delay < 0:
+            raise ValueError(f'Invalid coalesce_delay: {self.coalesce_delay * 1000}')
+        self.coalesce_max = int(self.plugin_opts.get('coalesce_max', self.read_buf_size))
+        if self.coalesce_max <= 0:
+            raise ValueError(f'Invalid coalesce_max: {self.coalesce_max}')
+        
+        # 多路复用（daemon 模式）：mux=N 时所有本地连接共享最多 N 条 WebSocket，0 为每连接独立 WebSocket
+        self.mux = int(self.plugin_opts.get('mux', '0'))
+        if self.mux < 0:
+            raise ValueError(f'Invalid mux: {self.mux}')
+        self.mux_sessions = []
+        self.mux_tasks = set()
+        self.mux_lock = asyncio.Lock()
+        
+        # 条带化（默认关闭）：stripe=K（2~16）时每个本地连接分散到 K 条并行 WebSocket
+        self.stripe = int(self.plugin_opts.get('stripe', '0'))
+        if self.stripe == 1 or not 0 <= self.stripe <= CFG_STRIPE_MAX_LANES:
+            raise ValueError(f'Invalid stripe: {self.stripe}')
+        
+        # 预建连接池（daemon 模式且未启用 mux）：保持 pool_min~pool_max 条已完成握手的空闲 WebSocket，
+        # 空闲超过 pool_max_age 秒后丢弃；pool_min=0 为不启用
+        self.pool_min = int(self.plugin_opts.get('pool_min', '0'))
+        self.pool_max = int(self.plugin_opts.get('pool_max', max(self.pool_min, CFG_POOL_MAX_IDLE)))
+        self.pool_max_age = float(self.plugin_opts.get('pool_max_age', CFG_POOL_MAX_AGE))
+        if self.pool_min < 0 or self.pool_max < self.pool_min:
+            raise ValueError(f'Invalid pool size: pool_min={self.pool_min}, pool_max={self.pool_max}')
+        self.ws_pool = None
+        
+        # TLS 会话复用（默认开启）：所有连接共用一个 SSLContext，并以最近一次握手的会话恢复后续连接
+        self.tls_resume = self.plugin_opts.get('tls_resume', 'true').lower() in ('true', '1', 'yes')
+        self.ssl_context = None
+        self.tls_full_handshakes = 0
+        self.tls_resumed_handshakes = 0
+        
+        # 流水线转发（默认关闭）：每个方向拆分为读取、加扰/去加扰、写出三个阶段，
+        # 阶段间队列达到 pipeline_buffer 字节时暂停读取，降到一半时恢复
+        self.pipeline = self.plugin_opts.get('pipeline', 'false').lower() in ('true', '1', 'yes')
+        self.pipeline_buffer = int(self.plugin_opts.get('pipeline_buffer', CFG_PIPELINE_HIGH_WATER))
+        if self.pipeline_buffer <= 0:
+            raise ValueError(f'Invalid pipeline_buffer: {self.pipeline_buffer}')
+        
+        # 大帧加扰卸载（默认关闭）：达到 offload_threshold 字节的帧交给线程池（C 加速释放 GIL 时）
+        # 或进程池处理，offload_workers 默认为 CPU 核数
+        self.offload = None
+        if self.plugin_opts.get('offload', 'false').lower() in ('true', '1', 'yes'):
+            self.offload = CodecOffload(
+                int(self.plugin_opts.get('offload_threshold', CFG_OFFLOAD_THRESHOLD)),
+                int(self.plugin_opts.get('offload_workers', '0')) or None,
+            )
+        
+        # 事件循环与套接字调优（默认关闭）：uvloop=true 时使用 uvloop（需已安装），nodelay=true 设置 TCP_NODELAY，
+        # sndbuf/rcvbuf 设置套接字缓冲区大小（字节）
+        self.use_uvloop = self.plugin_opts.get('uvloop', 'false').lower() in ('true', '1', 'yes')
+        self.nodelay = self.plugin_opts.get('nodelay', 'false').lower() in ('true', '1', 'yes')
+        self.sndbuf = int(self.plugin_opts.get('sndbuf', '0'))
+        self.rcvbuf = int(self.plugin_opts.get('rcvbuf', '0'))
+        
+        # 指标（默认关闭）：metrics=host:port 或 metrics=unix:/path 时以 Prometheus 文本格式暴露计数器，
+        # 并统计每帧的字节数与加扰耗时
+        self.metrics_address = self.plugin_opts.get('metrics')
+        self.metrics = MetricsRegistry()
+        self.metrics.add_collector(self._collect_metrics)
+        self.metrics_server = None
+        
+        # 阶段耗时直方图（默认关闭）：stage_timing=true 时记录转发热路径各阶段（读取等待、加扰、发送、
+        # 接收等待、去加扰、写入）的耗时，每 stage_report 秒输出增量摘要，SIGUSR1 输出累计摘要
+        self.stage_timings = None
+        if self.plugin_opts.get('stage_timing', 'false').lower() in ('true', '1', 'yes'):
+            self.stage_timings = StageTimings(self.metrics)
+        self.stage_report = float(self.plugin_opts.get('stage_report', CFG_STAGE_REPORT_INTERVAL))
+        self.stage_reporter = None
+        
+        # 数据加扰器 - 使用固定密钥，按 (编解码器, 参数) 缓存无状态实例
+        self.obfs_key = 'wss_plugin_default_key'
+        self.codecs = {}
         
         protocol = 'wss' if self.use_ssl else 'ws'
         logger.info(f'Client initialized: local={self.ss_local_host}:{self.ss_local_port}, '
                    f'remote={protocol}://{self.wss_host}:{self.wss_port}')
     
-    def _parse_plugin_opts(self, opts_str: str) -> dict:
+    @staticmethod
+    def _parse_plugin_opts(opts_str: str) -> dict:
         """解析插件选项字符串"""
         opts = {}
         if not opts_str:
@@ -118,9 +265,21 @@ class WSSPluginClient:
         
         return opts
     
+    def log_event_loop(self):
+        """记录当前事件循环实现（请求了 uvloop 但未安装时给出警告）"""
+        loop_type = type(asyncio.get_running_loop())
+        if self.use_uvloop and not loop_type.__module__.startswith('uvloop'):
+            logger.warning('uvloop requested but not installed, using the default event loop')
+        else:
+            logger.info(f'Event loop: {loop_type.__module__}.{loop_type.__name__}')
+    
+    def tune_socket(self, sock, keepalive: int = 0):
+        """按插件选项设置 TCP 套接字选项"""
+        tune_socket(sock, nodelay=self.nodelay, sndbuf=self.sndbuf, rcvbuf=self.rcvbuf, keepalive=keepalive)
+    
     def _create_ssl_context(self) -> ssl.SSLContext:
         """创建SSL上下文"""
-        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ssl_context = SessionReuseContext(ssl.PROTOCOL_TLS_CLIENT)
         
         # 跳过所有证书验证（允许自签名和任何证书）
         ssl_context.check_hostname = False
@@ -133,11 +292,82 @@ class WSSPluginClient:
         
         return ssl_context
     
-    async def connect_websocket(self):
-        """连接到WSS/WS服务器，返回websocket连接"""
+    def get_ssl_context(self) -> ssl.SSLContext:
+        """返回缓存的 SSL 上下文（首次调用时创建）"""
+        if self.ssl_context is None:
+            self.ssl_context = self._create_ssl_context()
+        return self.ssl_context
+    
+    def _remember_tls_session(self, websocket) -> bool:
+        """记录握手是否为会话恢复（返回值），并保存可恢复的会话供后续连接使用"""
+        ssl_object = websocket.transport.get_extra_info('ssl_object')
+        if ssl_object is None:
+            return False
+        if ssl_object.session_reused:
+            self.tls_resumed_handshakes += 1
+        else:
+            self.tls_full_handshakes += 1
+        logger.debug('TLS handshake: %s, resumed=%s (full=%d, resumed=%d)', ssl_object.version(),
+                     ssl_object.session_reused, self.tls_full_handshakes, self.tls_resumed_handshakes)
+        
+        # TLS 1.3 的会话票据在握手后才送达，WebSocket 升级响应读完时通常已经收到
+        session = ssl_object.session
+        if self.tls_resume and session is not None and (session.has_ticket or ssl_object.version() != 'TLSv1.3'):
+            self.ssl_context.session = session
+        return ssl_object.session_reused
+    
+    def _offered_subprotocols(self) -> Optional[list]:
+        """
+        返回握手时提供的子协议列表（按优先级）
+        
+        首选配置的编解码器，其后是 legacy 的各帧格式版本；仅使用 legacy v1 时不提供。
+        """
+        subprotocols = []
+        if self.obfs != DEFAULT_CODEC:
+            subprotocols.append(subprotocol_for_codec(self.obfs, **self.obfs_options))
+        subprotocols += [
+            subprotocol_for_codec(DEFAULT_CODEC, version=version)
+            for version in SUPPORTED_FRAME_VERSIONS
+            if FRAME_V1 < version <= self.obfs_version
+        ]
+        return subprotocols or None
+    
+    def create_read_sizer(self, obfuscator) -> AdaptiveReadSize:
+        """为一个发送方向创建读取大小策略（上限不超过编解码器的 max_payload）"""
+        return AdaptiveReadSize(
+            min(self.read_buf_size, obfuscator.max_payload),
+            floor=self.read_buf_min,
+            adaptive=self.adaptive_read,
+        )
+    
+    def get_obfuscator(self, websocket):
+        """
+        根据协商的子协议返回该连接使用的编解码器
+        
+        无状态编解码器在连接间共享；有状态编解码器（如 stream）每次调用新建，
+        收发两个方向各自调用一次，因此各持有独立状态。
+        """
+        name, options = codec_from_subprotocol(websocket.subprotocol)
+        if CODECS[name].stateful:
+            return self._metered(create_codec(name, self.obfs_key, **options))
+        
+        cache_key = (name, tuple(sorted(options.items())))
+        codec = self.codecs.get(cache_key)
+        if codec is None:
+            codec = self.codecs[cache_key] = self._metered(create_codec(name, self.obfs_key, **options))
+        return codec
+    
+    def _metered(self, codec):
+        """启用指标时为编解码器加上帧统计包装（加扰方向为 upstream）"""
+        if not self.metrics_address:
+            return codec
+        return MeteredCodec(codec, self.metrics, 'upstream', 'downstream')
+    
+    async def connect_websocket(self, path: Optional[str] = None):
+        """连接到WSS/WS服务器，返回websocket连接（path 默认为 wss_path）"""
         protocol = 'wss' if self.use_ssl else 'ws'
-        uri = f"{protocol}://{self.wss_host}:{self.wss_port}{self.wss_path}"
-        ssl_context = self._create_ssl_context() if self.use_ssl else None
+        uri = f"{protocol}://{self.wss_host}:{self.wss_port}{path or self.wss_path}"
+        ssl_context = self.get_ssl_context() if self.use_ssl else None
         
         # 浏览器 User-Agent
         additional_headers = [
@@ -145,78 +375,286 @@ class WSSPluginClient:
         ]
         
         try:
-            logger.info(f'Connecting to {uri}...')
+            logger.info('Connecting to %s...', uri)
+            started = time.perf_counter()
             websocket = await ws_connect(
                 uri,
                 ssl=ssl_context,
                 additional_headers=additional_headers,
+                subprotocols=self._offered_subprotocols(),
                 max_size=16 * 1024 * 1024,  # 16MB max message size
                 ping_interval=30,
                 ping_timeout=10
             )
-            logger.info('WebSocket connected successfully')
+            elapsed = time.perf_counter() - started
+            self.tune_socket(websocket.transport.get_extra_info('socket'))
+            tls = 'none'
+            if ssl_context is not None:
+                tls = 'resumed' if self._remember_tls_session(websocket) else 'full'
+            self.metrics.histogram('websocket_connect_seconds', 'TCP, TLS and WebSocket handshake duration',
+                                   tls=tls).observe(elapsed)
+            logger.info('WebSocket connected successfully (subprotocol=%s)', websocket.subprotocol)
             return websocket
         except Exception as e:
-            logger.error(f'Failed to connect to WebSocket: {e}')
+            self.metrics.count_error('websocket_connect', e)
+            error_log.error('Failed to connect to WebSocket: %s', e)
             return None
     
+    async def _ping_websocket(self, websocket) -> bool:
+        """连接池巡检：ping 空闲 WebSocket，超时视为不可用"""
+        pong_waiter = await websocket.ping()
+        await asyncio.wait_for(pong_waiter, CFG_POOL_PING_TIMEOUT)
+        return True
+    
+    def create_pool(self) -> ConnectionPool:
+        """创建预建 WebSocket 连接池"""
+        return ConnectionPool(
+            self.connect_websocket,
+            lambda websocket: websocket.close(),
+            is_alive=lambda websocket: websocket.state is State.OPEN,
+            check=self._ping_websocket,
+            min_idle=self.pool_min,
+            max_idle=self.pool_max,
+            max_age=self.pool_max_age,
+            name='websocket-pool',
+        )
+    
     async def handle_local_to_remote(self, websocket, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, running: dict):
         """处理从本地到远程的数据流"""
+        obfuscator = self.get_obfuscator(websocket)
+        offloaded = self.offload.bind(obfuscator, self.obfs_key, websocket.subprotocol) if self.offload else None
+        sizer = self.create_read_sizer(obfuscator)
+        read_size = sizer.size
+        # 每个连接复用的加扰输出缓冲区，按读取上限分配（send 返回前帧已序列化，可安全复用）
+        tx_buffer = bytearray(obfuscator.max_frame_size(sizer.ceiling))
+        tx_view = memoryview(tx_buffer)
+        coalesce_max = min(self.coalesce_max, sizer.ceiling)
+        eof = False
         try:
+            if self.pipeline:
+                stats = await run_pipeline(
+                    stream_source(reader, sizer, self.coalesce_delay, coalesce_max),
+                    pipeline_obfuscator(obfuscator, offloaded),
+                    websocket.send,
+                    self.pipeline_buffer,
+                )
+                logger.debug('local_to_remote pipeline stats: %s', stats)
+                return
+            
+            clock = self.stage_timings.clock() if self.stage_timings else None  # 阶段计时（opt-in）
+            trace = frame_trace(logger, self.trace_every)  # 逐帧采样跟踪（仅 DEBUG）
             while running['active']:
                 # 从本地Shadowsocks读取数据
-                data = await reader.read(8192)
+                if clock:
+                    clock.start()
+                data = await reader.read(read_size)
                 if not data:
                     logger.debug('Local connection closed')
                     break
                 
+                # 写合并：短时间内的多次小读取合并为一帧发送
+                if self.coalesce_delay:
+                    data, eof = await coalesce_reads(reader, data, coalesce_max, self.coalesce_delay)
+                
+                if clock:
+                    clock.lap(STAGE_READ_WAIT)
+                
                 # 数据加扰
-                obfuscated_data = self.obfuscator.obfuscate(data)
+                if offloaded and len(data) >= offloaded.threshold:
+                    frame_len = await offloaded.obfuscate_into(data, tx_buffer)
+                else:
+                    frame_len = obfuscator.obfuscate_into(data, tx_buffer)
+                if clock:
+                    clock.lap(STAGE_OBFUSCATE)
                 
                 # 发送到WSS服务器
-                await websocket.send(obfuscated_data)
-                logger.debug(f'Sent {len(data)} bytes (obfuscated to {len(obfuscated_data)} bytes)')
+                await websocket.send(tx_view[:frame_len])
+                if clock:
+                    clock.lap(STAGE_WS_SEND)
+                if trace and trace.sample():
+                    logger.debug('Sent %d bytes (obfuscated to %d bytes, read_size=%d)', len(data), frame_len, read_size)
+                
+                # 根据本次读取量调整下一次的读取大小
+                read_size = sizer.update(len(data))
+                if eof:
+                    logger.debug('Local connection closed')
+                    break
                 
         except Exception as e:
-            logger.error(f'Error in local_to_remote: {e}')
+            if not isinstance(e, ConnectionClosedOK):  # 正常关闭不计为错误
+                self.metrics.count_error('relay', e)
+            error_log.error('Error in local_to_remote: %s', e)
         finally:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('local_to_remote read stats: %s', sizer.stats())
             running['active'] = False
             writer.close()
             await writer.wait_closed()
     
     async def handle_remote_to_local(self, websocket, writer: asyncio.StreamWriter, running: dict):
         """处理从远程到本地的数据流"""
+        obfuscator = self.get_obfuscator(websocket)
+        offloaded = self.offload.bind(obfuscator, self.obfs_key, websocket.subprotocol) if self.offload else None
         try:
+            if self.pipeline:
+                async def write(data):
+                    writer.write(data)
+                    await writer.drain()
+                
+                stats = await run_pipeline(
+                    websocket.recv,
+                    pipeline_deobfuscator(obfuscator, offloaded),
+                    write,
+                    self.pipeline_buffer,
+                )
+                logger.debug('remote_to_local pipeline stats: %s', stats)
+                return
+            
+            clock = self.stage_timings.clock() if self.stage_timings else None  # 阶段计时（opt-in）
+            trace = frame_trace(logger, self.trace_every)  # 逐帧采样跟踪（仅 DEBUG）
             while running['active']:
                 # 从WSS服务器接收数据
+                if clock:
+                    clock.start()
                 obfuscated_data = await websocket.recv()
+                if clock:
+                    clock.lap(STAGE_RECV_WAIT)
                 
-                # 数据去加扰
-                data = self.obfuscator.deobfuscate(obfuscated_data)
+                # 数据去加扰（在消息副本上原地进行；传输层可能延迟发送，副本不复用）
+                if offloaded and len(obfuscated_data) >= offloaded.threshold:
+                    data = await offloaded.deobfuscate(obfuscated_data)
+                else:
+                    data = obfuscator.deobfuscate_inplace(bytearray(obfuscated_data))
+                if clock:
+                    clock.lap(STAGE_DEOBFUSCATE)
                 
                 # 写入本地Shadowsocks
                 writer.write(data)
                 await writer.drain()
-                logger.debug(f'Received {len(obfuscated_data)} bytes (deobfuscated to {len(data)} bytes)')
+                if clock:
+                    clock.lap(STAGE_DRAIN)
+                if trace and trace.sample():
+                    logger.debug('Received %d bytes (deobfuscated to %d bytes)', len(obfuscated_data), len(data))
                 
         except Exception as e:
-            logger.error(f'Error in remote_to_local: {e}')
+            if not isinstance(e, ConnectionClosedOK):  # 正常关闭不计为错误
+                self.metrics.count_error('relay', e)
+            error_log.error('Error in remote_to_local: %s', e)
         finally:
             running['active'] = False
             writer.close()
             await writer.wait_closed()
     
+    async def get_mux_session(self) -> Optional[MuxSession]:
+        """
+        返回一个可用的复用会话
+        
+        会话数不足 mux 时新建（建连期间加锁，避免并发连接同时建出多余会话），
+        否则选择当前流最少的会话。
+        """
+        async with self.mux_lock:
+            self.mux_sessions = [session for session in self.mux_sessions if not session.closed]
+            if len(self.mux_sessions) < self.mux:
+                websocket = await self.connect_websocket(self.wss_path + MUX_PATH_SUFFIX)
+                if websocket:
+                    session = MuxSession(
+                        websocket,
+                        self.get_obfuscator(websocket),
+                        self.get_obfuscator(websocket),
+                        self.read_buf_size,
+                    )
+                    task = asyncio.create_task(self._run_mux_session(session))
+                    self.mux_tasks.add(task)
+                    task.add_done_callback(self.mux_tasks.discard)
+                    self.mux_sessions.append(session)
+                    logger.info('Mux session opened (%d/%d)', len(self.mux_sessions), self.mux)
+            if not self.mux_sessions:
+                return None
+            return min(self.mux_sessions, key=lambda session: len(session.streams))
+    
+    async def _run_mux_session(self, session: MuxSession):
+        """运行复用会话，结束后关闭 WebSocket"""
+        try:
+            await session.run()
+        finally:
+            await session.websocket.close()
+            logger.info('Mux session closed')
+    
+    async def handle_client_mux(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """通过复用会话转发单个客户端连接（新连接无需额外握手）"""
+        session = await self.get_mux_session()
+        if session is None:
+            error_log.error('Failed to establish mux WebSocket connection')
+            writer.close()
+            await writer.wait_closed()
+            return
+        
+        stream = session.open_stream()
+        logger.debug('Mux stream %d opened (%d active on session)', stream.id, len(session.streams))
+        sizer = AdaptiveReadSize(session.max_data, floor=self.read_buf_min, adaptive=self.adaptive_read)
+        await session.relay(stream, reader, writer, sizer, self.coalesce_delay, self.coalesce_max)
+    
+    async def handle_client_striped(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """把单个客户端连接条带化到 stripe 条并行 WebSocket"""
+        flow_id = new_flow_id()
+        websockets = await asyncio.gather(*(
+            self.connect_websocket(stripe_path(self.wss_path, flow_id, self.stripe, lane))
+            for lane in range(self.stripe)
+        ))
+        try:
+            if not all(websockets):
+                error_log.error('Failed to establish striped WebSocket connections')
+                writer.close()
+                await writer.wait_closed()
+                return
+            
+            logger.debug('Striped flow %s established (%d lanes)', flow_id, self.stripe)
+            flow = StripedFlow(
+                websockets,
+                [self.get_obfuscator(websocket) for websocket in websockets],
+                [self.get_obfuscator(websocket) for websocket in websockets],
+                self.read_buf_size,
+            )
+            sizer = AdaptiveReadSize(flow.max_data, floor=self.read_buf_min, adaptive=self.adaptive_read)
+            await flow.relay(reader, writer, sizer, self.coalesce_delay, self.coalesce_max)
+        finally:
+            await asyncio.gather(*(websocket.close() for websocket in websockets if websocket))
+    
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         """处理单个客户端连接"""
         client_addr = writer.get_extra_info('peername')
-        logger.info(f'New client connection from {client_addr}')
+        logger.info('New client connection from %s', client_addr)
+        self.tune_socket(writer.get_extra_info('socket'))
+        
+        if self.stripe:
+            try:
+                await self.handle_client_striped(reader, writer)
+            except Exception as e:
+                self.metrics.count_error('client', e)
+                error_log.error('Error handling striped client: %s', e)
+            finally:
+                logger.info('Client connection closed %s', client_addr)
+            return
+        
+        if self.mux:
+            try:
+                await self.handle_client_mux(reader, writer)
+            except Exception as e:
+                self.metrics.count_error('client', e)
+                error_log.error('Error handling mux client: %s', e)
+            finally:
+                logger.info('Client connection closed %s', client_addr)
+            return
         
         websocket = None
         try:
-            # 连接到WSS服务器（每个客户端独立连接）
-            websocket = await self.connect_websocket()
+            # 连接到WSS服务器（每个客户端独立连接，启用连接池时取用预建连接）
+            if self.ws_pool:
+                websocket = await self.ws_pool.acquire()
+            else:
+                websocket = await self.connect_websocket()
             if not websocket:
-                logger.error('Failed to establish WebSocket connection')
+                error_log.error('Failed to establish WebSocket connection')
                 writer.close()
                 await writer.wait_closed()
                 return
@@ -242,35 +680,131 @@ class WSSPluginClient:
                     pass
             
         except Exception as e:
-            logger.error(f'Error handling client: {e}')
+            self.metrics.count_error('client', e)
+            error_log.error('Error handling client: %s', e)
         finally:
             if websocket:
                 await websocket.close()
-            logger.info(f'Client connection closed {client_addr}')
+            logger.info('Client connection closed %s', client_addr)
+    
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """start_server 的连接处理入口：登记连接任务后交给 handle_client"""
+        task = asyncio.current_task()
+        self.connection_tasks.add(task)
+        self.connections_total += 1
+        try:
+            await self.handle_client(reader, writer)
+        except asyncio.CancelledError:
+            # 退出时超过等待时间被 shutdown 取消：关闭本地连接，不向 start_server 的回调传播
+            writer.close()
+        finally:
+            self.connection_tasks.discard(task)
+    
+    async def start_metrics(self, endpoint: bool = True):
+        """按选项启动指标端点与阶段耗时摘要任务（endpoint 为 False 时只启动摘要任务，供 per-connection 模式使用）"""
+        if self.stage_timings is not None:
+            # 阶段计时只覆盖普通转发循环，流水线、mux 与条带化路径的直方图会一直为空
+            untimed = [name for name, enabled in (
+                ('pipeline', self.pipeline), ('mux', self.mux), ('stripe', self.stripe)) if enabled]
+            if untimed:
+                logger.warning('stage_timing does not cover %s; those connections are not timed',
+                               ', '.join(untimed))
+            self.stage_reporter = asyncio.create_task(
+                report_stage_timings(self.stage_timings, self.stage_report, logger))
+        if endpoint and self.metrics_address:
+            self.metrics_server = await start_metrics_server(self.metrics, self.metrics_address)
+    
+    async def stop_metrics(self):
+        """关闭指标端点与阶段耗时摘要任务"""
+        if self.stage_reporter is not None:
+            self.stage_reporter.cancel()
+            try:
+                await self.stage_reporter
+            except asyncio.CancelledError:
+                pass
+            self.stage_reporter = None
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            await self.metrics_server.wait_closed()
+            self.metrics_server = None
+    
+    def _collect_metrics(self) -> list:
+        """抓取时读取连接、TLS 握手、连接池与复用会话的状态"""
+        samples = [
+            ('connections_active', 'gauge', 'Active local connections', len(self.connection_tasks), {}),
+            ('connections_total', 'counter', 'Accepted local connections', self.connections_total, {}),
+            ('tls_handshakes_total', 'counter', 'TLS handshakes by resumption',
+             self.tls_full_handshakes, {'resumed': 'false'}),
+            ('tls_handshakes_total', 'counter', 'TLS handshakes by resumption',
+             self.tls_resumed_handshakes, {'resumed': 'true'}),
+            ('mux_sessions_active', 'gauge', 'Open mux sessions',
+             sum(1 for session in self.mux_sessions if not session.closed), {}),
+        ]
+        if self.ws_pool:
+            labels = {'pool': self.ws_pool.name}
+            samples += [
+                ('pool_idle', 'gauge', 'Idle pre-connected connections', self.ws_pool.idle, labels),
+                ('pool_hits_total', 'counter', 'Pool acquisitions served from idle connections',
+                 self.ws_pool.hits, labels),
+                ('pool_misses_total', 'counter', 'Pool acquisitions that had to connect',
+                 self.ws_pool.misses, labels),
+            ]
+        return samples
+    
+    async def shutdown(self, grace: float = CFG_SHUTDOWN_GRACE):
+        """停止服务：等待活跃连接结束（最多 grace 秒）后取消剩余连接，并关闭 mux 会话与连接池"""
+        tasks = list(self.connection_tasks)
+        if tasks:
+            logger.info(f'Waiting up to {grace}s for {len(tasks)} active connections')
+            done, pending = await asyncio.wait(tasks, timeout=grace)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for session in self.mux_sessions:
+            await session.websocket.close()
+        if self.ws_pool:
+            await self.ws_pool.close()
+            self.ws_pool = None
+        await self.stop_metrics()
     
     async def start(self):
-        """启动客户端服务"""
+        """启动客户端服务（daemon 模式），收到 SIGTERM/SIGINT 后优雅退出"""
         logger.info(f'Starting WSS Plugin Client on {self.ss_local_host}:{self.ss_local_port}')
         
         server = await asyncio.start_server(
-            self.handle_client,
+            self.handle_connection,
             self.ss_local_host,
-            self.ss_local_port
+            self.ss_local_port,
+            backlog=CFG_LISTEN_BACKLOG
         )
         
         addrs = ', '.join(str(sock.getsockname()) for sock in server.sockets)
         logger.info(f'WSS Plugin Client listening on {addrs}')
+        await self.start_metrics()
+        
+        if self.pool_min and not self.mux and not self.stripe:
+            self.ws_pool = self.create_pool()
+            self.ws_pool.start()
+            logger.info(f'WebSocket pool enabled: min_idle={self.pool_min}, max_idle={self.pool_max}, '
+                       f'max_age={self.pool_max_age}s')
         
-        async with server:
-            await server.serve_forever()
+        try:
+            await wait_for_shutdown()
+            logger.info('Received shutdown signal, stopping client...')
+        finally:
+            # 先停止接受新连接，再处理已有连接
+            server.close()
+            await self.shutdown()
+            await server.wait_closed()
 
 
 async def main():
     """主函数 - 支持 per-connection 和 daemon 两种模式"""
     try:
         client = WSSPluginClient()
+        client.log_event_loop()
         
-        if CFG_PRE_CONNECTION:
+        if client.mode == 'per-connection':
             # Per-connection mode：处理单个连接后退出
             logger.info('Running in per-connection mode')
             await main_per_connection(client)
@@ -288,6 +822,7 @@ async def main():
 
 async def main_per_connection(client):
     """Per-connection mode - 处理单个连接，通常由 ss-libev 为每个客户端连接调用一次"""
+    await client.start_metrics(endpoint=False)
     try:
         # 连接到本地 Shadowsocks（ss-libev 为该连接提供）
         logger.debug(f'Connecting to local Shadowsocks at {client.ss_local_host}:{client.ss_local_port}')
@@ -295,6 +830,7 @@ async def main_per_connection(client):
             client.ss_local_host,
             client.ss_local_port
         )
+        client.tune_socket(ss_writer.get_extra_info('socket'))
         logger.debug(f'Connected to local Shadowsocks')
         
         # 连接到远程 WSS/WS 服务器
@@ -341,7 +877,16 @@ async def main_per_connection(client):
         if 'ss_writer' in locals():
             ss_writer.close()
             await ss_writer.wait_closed()
+        await client.stop_metrics()
 
 
-if __name__ == '__main__':
+def run():
+    """命令行入口：按插件选项选择事件循环后运行 main()"""
+    plugin_opts = WSSPluginClient._parse_plugin_opts(os.environ.get('SS_PLUGIN_OPTIONS', ''))
+    if plugin_opts.get('uvloop', 'false').lower() in ('true', '1', 'yes'):
+        install_uvloop()
     asyncio.run(main())
+
+
+if __name__ == '__main__':
+    run()
@@ -6,70 +6,97 @@ Shadowsocks SIP003 Plugin - WebSocket Server
 """
 
 import asyncio
+import multiprocessing
 import os
 import sys
 import ssl
+import socket
 import logging
 import pathlib
+import signal
+import time
 from typing import Optional
 
 # 配置常量
 CFG_MAX_MESSAGE_SIZE = 16 * 1024 * 1024  # 16MB
 CFG_PING_INTERVAL = 30 # ping every 30 seconds
 CFG_PING_TIMEOUT = 10 # timeout if no pong within 10 seconds
-CFG_READ_BUF_SIZE = 8192  # 8KB
-CFG_PRE_CONNECTION = True  # True: per-connection mode (for ss-libev), False: daemon mode (standalone)
+CFG_READ_BUF_SIZE = 64 * 1024  # 64KB（单次读取上限，不超过所协商帧格式的 max_payload）
+CFG_WORKER_STATS_INTERVAL = 60  # 多进程模式下汇总统计的日志间隔（秒）
+CFG_WORKER_RESTART_MIN = 1  # 工作进程异常退出后的重启退避（秒）
+CFG_WORKER_RESTART_MAX = 30
+CFG_WORKER_MIN_UPTIME = 10  # 运行不足该时间即退出视为启动失败，退避加倍
+CFG_TLS_TICKETS = 2  # 每次完整握手签发的 TLS 1.3 会话票据数（0 为不签发）
+CFG_DEFAULT_MODE = 'daemon'  # 默认运行模式，可由插件选项 mode 覆盖
+CFG_LISTEN_BACKLOG = 1024  # 监听队列长度（并发建连较多时避免 SYN 重传）
+
+# 运行模式：daemon 持续服务所有连接；per-connection 兼容旧版 ss-libev 的每连接启动方式
+RUN_MODES = ('daemon', 'per-connection')
 
 # 导入websockets库
 PATH_WEBSOCKETS = pathlib.Path(__file__).parent / "websockets" / "src"
 sys.path.insert(0, str(PATH_WEBSOCKETS))
 
-from websockets.asyncio.server import serve
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.exceptions import ConnectionClosedOK
 
 # 导入加扰模块
-from obfuscator import DataObfuscator
+from obfuscator import (
+    CODECS,
+    DEFAULT_CODEC,
+    FRAME_V3,
+    SUPPORTED_FRAME_VERSIONS,
+    codec_from_subprotocol,
+    create_codec,
+    subprotocol_for_codec,
+)
+from mux import MUX_PATH_SUFFIX, MuxSession
+from striping import CFG_STRIPE_GROUP_TIMEOUT, StripedFlow, StripeGroup, parse_stripe_path
+from pool import CFG_POOL_MAX_AGE, CFG_POOL_MAX_IDLE, ConnectionPool
+from tracing import CFG_TRACE_SAMPLE_EVERY, RateLimitedLog, frame_trace, setup_logging
+from metrics import (
+    CFG_STAGE_REPORT_INTERVAL,
+    STAGE_DEOBFUSCATE,
+    STAGE_DRAIN,
+    STAGE_OBFUSCATE,
+    STAGE_READ_WAIT,
+    STAGE_RECV_WAIT,
+    STAGE_WS_SEND,
+    MeteredCodec,
+    MetricsRegistry,
+    StageTimings,
+    report_stage_timings,
+    start_metrics_server,
+    worker_address,
+)
+from offload import CFG_OFFLOAD_THRESHOLD, CodecOffload, pipeline_deobfuscator, pipeline_obfuscator
+from relay import (
+    CFG_ADAPTIVE_READ_MIN,
+    CFG_COALESCE_DELAY_MS,
+    CFG_PIPELINE_HIGH_WATER,
+    AdaptiveReadSize,
+    coalesce_reads,
+    install_uvloop,
+    run_pipeline,
+    stream_source,
+    tune_socket,
+    wait_for_shutdown,
+)
+
 
+logger = logging.getLogger('wss-plugin-server')
+error_log = RateLimitedLog(logger)  # 每连接错误日志的限频输出
 
-def setup_logging(debug=False, log_file=None):
-    """配置日志系统"""
-    log_level = logging.DEBUG if debug else logging.INFO
-    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    
-    handlers = []
-    
-    # 控制台输出
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(log_format))
-    handlers.append(console_handler)
-    
-    # 文件输出（如果指定）
-    if log_file:
-        file_handler = logging.FileHandler(log_file, mode='a', encoding='utf-8')
-        file_handler.setFormatter(logging.Formatter(log_format))
-        handlers.append(file_handler)
-    
-    # 配置根日志
-    logging.basicConfig(
-        level=log_level,
-        format=log_format,
-        handlers=handlers,
-        force=True
-    )
-    
-    # 配置 SSL、websockets 和插件日志
-    if debug:
-        logging.getLogger('ssl').setLevel(logging.DEBUG)
-        logging.getLogger('websockets').setLevel(logging.DEBUG)
-        logging.getLogger('wss-plugin-server').setLevel(logging.DEBUG)
-        logging.getLogger('wss-plugin-client').setLevel(logging.DEBUG)
-    else:
-        logging.getLogger('ssl').setLevel(logging.INFO)
-        logging.getLogger('websockets').setLevel(logging.INFO)
-        logging.getLogger('wss-plugin-server').setLevel(logging.INFO)
-        logging.getLogger('wss-plugin-client').setLevel(logging.INFO)
+# 工作进程写入共享内存的统计字段（每个工作进程一组）
+WORKER_STAT_FIELDS = ('connections_total', 'connections_active')
 
 
-logger = logging.getLogger('wss-plugin-server')
+class TimedServerConnection(ServerConnection):
+    """记录 TCP 接受时刻的连接，用于统计服务端握手（TLS + WebSocket）耗时"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accepted_at = time.perf_counter()
 
 class WSSPluginServer:
     """WSS Plugin 服务端实现"""
@@ -90,6 +117,11 @@ class WSSPluginServer:
         log_file = self.plugin_opts.get('log_file', None)
         setup_logging(debug=debug, log_file=log_file)
         
+        # 逐帧跟踪（仅 DEBUG 级别）：每 trace_every 帧输出 1 条，1 为每帧都输出
+        self.trace_every = int(self.plugin_opts.get('trace_every', CFG_TRACE_SAMPLE_EVERY))
+        if self.trace_every < 1:
+            raise ValueError(f'Invalid trace_every: {self.trace_every}')
+        
         # 证书配置
         self.cert_file = self.plugin_opts.get('cert', None)
         self.key_file = self.plugin_opts.get('key', None)
@@ -107,13 +139,129 @@ class WSSPluginServer:
         self.backend_host = self.ss_local_host  # SS 内部监听地址
         self.backend_port = self.ss_local_port  # SS 内部监听端口
         
-        # 数据加扰器 - 使用固定密钥
-        self.obfuscator = DataObfuscator('wss_plugin_default_key')
+        # 可接受的编解码器（逗号分隔，默认全部）；legacy v1 始终接受以兼容旧版客户端
+        self.accepted_codecs = [
+            name.strip()
+            for name in self.plugin_opts.get('obfs', ','.join(CODECS)).split(',')
+            if name.strip()
+        ]
+        for name in self.accepted_codecs:
+            if name not in CODECS:
+                raise ValueError(f'Unsupported obfs codec: {name}')
+        
+        # 可接受的最高 legacy 帧格式版本（通过 WebSocket 子协议协商，未协商的旧版客户端使用 v1）
+        self.obfs_version = int(self.plugin_opts.get('obfs_version', FRAME_V3))
+        if self.obfs_version not in SUPPORTED_FRAME_VERSIONS:
+            raise ValueError(f'Unsupported obfs_version: {self.obfs_version}')
+        
+        # 单次读取的最大字节数（每帧承载的最大数据量），legacy v1/v2 帧不超过64KB
+        self.read_buf_size = int(self.plugin_opts.get('read_buf_size', CFG_READ_BUF_SIZE))
+        if self.read_buf_size <= 0:
+            raise ValueError(f'Invalid read_buf_size: {self.read_buf_size}')
+        
+        # 自适应读取大小：批量传输时逐步增大到 read_buf_size，交互式流量时缩小到 read_buf_min
+        self.adaptive_read = self.plugin_opts.get('adaptive_read', 'true').lower() in ('true', '1', 'yes')
+        self.read_buf_min = int(self.plugin_opts.get('read_buf_min', CFG_ADAPTIVE_READ_MIN))
+        if self.read_buf_min <= 0:
+            raise ValueError(f'Invalid read_buf_min: {self.read_buf_min}')
+        
+        # 写合并（默认关闭）：小读取在 coalesce_delay 毫秒内合并为一帧，合并后不超过 coalesce_max 字节
+        self.coalesce_delay = float(self.plugin_opts.get('coalesce_delay', CFG_COALESCE_DELAY_MS)) / 1000
+        if self.coalesce_delay < 0:
+            raise ValueError(f'Invalid coalesce_delay: {self.coalesce_delay * 1000}')
+        self.coalesce_max = int(self.plugin_opts.get('coalesce_max', self.read_buf_size))
+        if self.coalesce_max <= 0:
+            raise ValueError(f'Invalid coalesce_max: {self.coalesce_max}')
+        
+        # 流水线转发（默认关闭）：每个方向拆分为读取、加扰/去加扰、写出三个阶段，
+        # 阶段间队列达到 pipeline_buffer 字节时暂停读取，降到一半时恢复
+        self.pipeline = self.plugin_opts.get('pipeline', 'false').lower() in ('true', '1', 'yes')
+        self.pipeline_buffer = int(self.plugin_opts.get('pipeline_buffer', CFG_PIPELINE_HIGH_WATER))
+        if self.pipeline_buffer <= 0:
+            raise ValueError(f'Invalid pipeline_buffer: {self.pipeline_buffer}')
+        
+        # 条带化流：流 ID -> StripeGroup（各通道到齐前的登记表）
+        self.stripe_groups = {}
+        self.stripe_tasks = set()  # 各条带化流的转发任务（停止服务时取消）
+        
+        # TLS 会话票据：每次完整握手签发 tls_tickets 张，客户端用于恢复会话，0 为关闭
+        self.tls_tickets = int(self.plugin_opts.get('tls_tickets', CFG_TLS_TICKETS))
+        if self.tls_tickets < 0:
+            raise ValueError(f'Invalid tls_tickets: {self.tls_tickets}')
+        
+        # 运行模式：daemon（默认）或 per-connection
+        self.mode = self.plugin_opts.get('mode', CFG_DEFAULT_MODE)
+        if self.mode not in RUN_MODES:
+            raise ValueError(f'Unsupported mode: {self.mode}')
+        
+        # 多进程模式：workers=N（或 auto 为 CPU 核数）个工作进程以 SO_REUSEPORT 绑定同一端口，默认单进程
+        workers = self.plugin_opts.get('workers', '1')
+        self.workers = (os.cpu_count() or 1) if workers == 'auto' else int(workers)
+        if self.workers < 1:
+            raise ValueError(f'Invalid workers: {workers}')
+        if self.workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+            raise ValueError('workers > 1 requires SO_REUSEPORT, which this platform does not support')
+        
+        # 连接统计（多进程模式下由 attach_worker_stats 同步到共享内存）
+        self.connections_total = 0
+        self.connections_active = 0
+        self.worker_stats = None
+        self.worker_index = None
+        
+        # 大帧加扰卸载（默认关闭）：达到 offload_threshold 字节的帧交给线程池（C 加速释放 GIL 时）
+        # 或进程池处理，offload_workers 默认为 CPU 核数
+        self.offload = None
+        if self.plugin_opts.get('offload', 'false').lower() in ('true', '1', 'yes'):
+            self.offload = CodecOffload(
+                int(self.plugin_opts.get('offload_threshold', CFG_OFFLOAD_THRESHOLD)),
+                int(self.plugin_opts.get('offload_workers', '0')) or None,
+            )
+        
+        # 后端预建连接池（默认关闭）：保持 backend_pool_min~backend_pool_max 条到后端的空闲 TCP 连接，
+        # 空闲超过 backend_pool_max_age 秒后丢弃；backend_pool_min=0 为不启用
+        self.backend_pool_min = int(self.plugin_opts.get('backend_pool_min', '0'))
+        self.backend_pool_max = int(self.plugin_opts.get('backend_pool_max',
+                                                         max(self.backend_pool_min, CFG_POOL_MAX_IDLE)))
+        self.backend_pool_max_age = float(self.plugin_opts.get('backend_pool_max_age', CFG_POOL_MAX_AGE))
+        if self.backend_pool_min < 0 or self.backend_pool_max < self.backend_pool_min:
+            raise ValueError(f'Invalid backend pool size: backend_pool_min={self.backend_pool_min}, '
+                             f'backend_pool_max={self.backend_pool_max}')
+        self.backend_pool = None
+        
+        # 事件循环与套接字调优（默认关闭）：uvloop=true 时使用 uvloop（需已安装），nodelay=true 设置 TCP_NODELAY，
+        # sndbuf/rcvbuf 设置套接字缓冲区大小（字节），
+        # keepalive=N 对后端连接启用 N 秒空闲后探测的 TCP keepalive
+        self.use_uvloop = self.plugin_opts.get('uvloop', 'false').lower() in ('true', '1', 'yes')
+        self.nodelay = self.plugin_opts.get('nodelay', 'false').lower() in ('true', '1', 'yes')
+        self.sndbuf = int(self.plugin_opts.get('sndbuf', '0'))
+        self.rcvbuf = int(self.plugin_opts.get('rcvbuf', '0'))
+        self.keepalive = int(self.plugin_opts.get('keepalive', '0'))
+        
+        # 指标（默认关闭）：metrics=host:port 或 metrics=unix:/path 时以 Prometheus 文本格式暴露计数器，
+        # 并统计每帧的字节数与加扰耗时；
+        # 多进程模式下第 i 个工作进程监听端口 +i（Unix 套接字为路径加 .i 后缀）
+        self.metrics_address = self.plugin_opts.get('metrics')
+        self.metrics = MetricsRegistry()
+        self.metrics.add_collector(self._collect_metrics)
+        self.metrics_server = None
+        
+        # 阶段耗时直方图（默认关闭）：stage_timing=true 时记录转发热路径各阶段（读取等待、加扰、发送、
+        # 接收等待、去加扰、写入）的耗时，每 stage_report 秒输出增量摘要，SIGUSR1 输出累计摘要
+        self.stage_timings = None
+        if self.plugin_opts.get('stage_timing', 'false').lower() in ('true', '1', 'yes'):
+            self.stage_timings = StageTimings(self.metrics)
+        self.stage_report = float(self.plugin_opts.get('stage_report', CFG_STAGE_REPORT_INTERVAL))
+        self.stage_reporter = None
+        
+        # 数据加扰器 - 使用固定密钥，按 (编解码器, 参数) 缓存无状态实例
+        self.obfs_key = 'wss_plugin_default_key'
+        self.codecs = {}
         
         logger.info(f'Server initialized: listen={self.wss_host}:{self.wss_port}, '
                    f'backend={self.backend_host}:{self.backend_port}')
     
-    def _parse_plugin_opts(self, opts_str: str) -> dict:
+    @staticmethod
+    def _parse_plugin_opts(opts_str: str) -> dict:
         """解析插件选项字符串"""
         opts = {}
         if not opts_str:
@@ -126,6 +274,18 @@ class WSSPluginServer:
         
         return opts
     
+    def log_event_loop(self):
+        """记录当前事件循环实现（请求了 uvloop 但未安装时给出警告）"""
+        loop_type = type(asyncio.get_running_loop())
+        if self.use_uvloop and not loop_type.__module__.startswith('uvloop'):
+            logger.warning('uvloop requested but not installed, using the default event loop')
+        else:
+            logger.info(f'Event loop: {loop_type.__module__}.{loop_type.__name__}')
+    
+    def tune_socket(self, sock, keepalive: int = 0):
+        """按插件选项设置 TCP 套接字选项"""
+        tune_socket(sock, nodelay=self.nodelay, sndbuf=self.sndbuf, rcvbuf=self.rcvbuf, keepalive=keepalive)
+    
     def _create_ssl_context(self) -> ssl.SSLContext:
         """创建SSL上下文"""
         ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
@@ -149,38 +309,174 @@ class WSSPluginServer:
         ssl_context.check_hostname = False
         ssl_context.verify_mode = ssl.CERT_NONE
         
+        # 会话恢复：TLS 1.3 签发会话票据，TLS 1.2 使用会话票据或服务端会话缓存
+        if self.tls_tickets:
+            ssl_context.options &= ~ssl.OP_NO_TICKET
+            ssl_context.num_tickets = self.tls_tickets
+        else:
+            ssl_context.options |= ssl.OP_NO_TICKET
+            ssl_context.num_tickets = 0
+        
         return ssl_context
     
+    def _select_subprotocol(self, connection, subprotocols) -> Optional[str]:
+        """
+        选择子协议（编解码器与帧格式版本）
+        
+        按客户端给出的优先级，取第一个本端接受的编解码器（legacy 版本不超过 obfs_version）；
+        客户端未提供或均不支持时返回 None，按旧格式 legacy v1 处理而不是拒绝握手。
+        """
+        for subprotocol in subprotocols:
+            name, options = codec_from_subprotocol(subprotocol)
+            if subprotocol != subprotocol_for_codec(name, **options):
+                continue
+            if name not in self.accepted_codecs:
+                continue
+            if name == DEFAULT_CODEC and options['version'] > self.obfs_version:
+                continue
+            return subprotocol
+        return None
+    
+    def create_read_sizer(self, obfuscator) -> AdaptiveReadSize:
+        """为一个发送方向创建读取大小策略（上限不超过编解码器的 max_payload）"""
+        return AdaptiveReadSize(
+            min(self.read_buf_size, obfuscator.max_payload),
+            floor=self.read_buf_min,
+            adaptive=self.adaptive_read,
+        )
+    
+    def get_obfuscator(self, websocket):
+        """
+        根据协商的子协议返回该连接使用的编解码器
+        
+        无状态编解码器在连接间共享；有状态编解码器（如 stream）每次调用新建，
+        收发两个方向各自调用一次，因此各持有独立状态。
+        """
+        name, options = codec_from_subprotocol(websocket.subprotocol)
+        if CODECS[name].stateful:
+            return self._metered(create_codec(name, self.obfs_key, **options))
+        
+        cache_key = (name, tuple(sorted(options.items())))
+        codec = self.codecs.get(cache_key)
+        if codec is None:
+            codec = self.codecs[cache_key] = self._metered(create_codec(name, self.obfs_key, **options))
+        return codec
+    
+    def _metered(self, codec):
+        """启用指标时为编解码器加上帧统计包装（加扰方向为 downstream）"""
+        if not self.metrics_address:
+            return codec
+        return MeteredCodec(codec, self.metrics, 'downstream', 'upstream')
+    
     async def connect_to_shadowsocks(self) -> tuple:
-        """连接到后端Shadowsocks服务器"""
+        """连接到后端Shadowsocks服务器（启用连接池时优先取用预建连接）"""
+        if self.backend_pool is not None:
+            return await self.backend_pool.acquire()
+        return await self.open_backend()
+    
+    async def open_backend(self) -> tuple:
+        """新建到后端的 TCP 连接"""
         try:
+            started = time.perf_counter()
             reader, writer = await asyncio.open_connection(
                 self.backend_host,
                 self.backend_port
             )
-            logger.debug(f'Connected to Shadowsocks backend at {self.backend_host}:{self.backend_port}')
+            self.metrics.histogram('backend_connect_seconds', 'Backend TCP connect latency').observe(
+                time.perf_counter() - started)
+            self.tune_socket(writer.get_extra_info('socket'), keepalive=self.keepalive)
+            logger.debug('Connected to Shadowsocks backend at %s:%d', self.backend_host, self.backend_port)
             return reader, writer
         except Exception as e:
-            logger.error(f'Failed to connect to Shadowsocks backend: {e}')
+            self.metrics.count_error('backend_connect', e)
+            error_log.error('Failed to connect to Shadowsocks backend: %s', e)
             raise
     
+    @staticmethod
+    async def _close_backend(connection: tuple):
+        """关闭连接池中不再使用的后端连接"""
+        _, writer = connection
+        writer.close()
+        await writer.wait_closed()
+    
+    @staticmethod
+    def _backend_alive(connection: tuple) -> bool:
+        """后端连接是否仍可用：空闲连接上后端不会主动发送数据，读到 EOF 或传输关闭即视为已断开"""
+        reader, writer = connection
+        return not reader.at_eof() and not writer.is_closing()
+    
+    def start_backend_pool(self):
+        """按选项启动后端预建连接池"""
+        if not self.backend_pool_min:
+            return
+        self.backend_pool = ConnectionPool(
+            self.open_backend,
+            self._close_backend,
+            is_alive=self._backend_alive,
+            min_idle=self.backend_pool_min,
+            max_idle=self.backend_pool_max,
+            max_age=self.backend_pool_max_age,
+            name='backend-pool',
+        )
+        self.backend_pool.start()
+        logger.info(f'Backend pool enabled: min_idle={self.backend_pool_min}, max_idle={self.backend_pool_max}, '
+                   f'max_age={self.backend_pool_max_age}s')
+    
+    async def close_backend_pool(self):
+        """停止后端预建连接池并关闭空闲连接"""
+        if self.backend_pool is not None:
+            await self.backend_pool.close()
+            self.backend_pool = None
+    
     async def handle_wss_to_ss(self, websocket, writer: asyncio.StreamWriter, running: dict):
         """处理从WSS客户端到Shadowsocks的数据流"""
+        obfuscator = self.get_obfuscator(websocket)
+        offloaded = self.offload.bind(obfuscator, self.obfs_key, websocket.subprotocol) if self.offload else None
         try:
+            if self.pipeline:
+                async def write(data):
+                    writer.write(data)
+                    await writer.drain()
+                
+                stats = await run_pipeline(
+                    websocket.recv,
+                    pipeline_deobfuscator(obfuscator, offloaded),
+                    write,
+                    self.pipeline_buffer,
+                )
+                logger.debug('WSS->SS pipeline stats: %s', stats)
+                return
+            
+            clock = self.stage_timings.clock() if self.stage_timings else None  # 阶段计时（opt-in）
+            trace = frame_trace(logger, self.trace_every)  # 逐帧采样跟踪（仅 DEBUG）
             while running['active']:
                 # 从WSS客户端接收数据
+                if clock:
+                    clock.start()
                 obfuscated_data = await websocket.recv()
+                if clock:
+                    clock.lap(STAGE_RECV_WAIT)
                 
-                # 数据去加扰
-                data = self.obfuscator.deobfuscate(obfuscated_data)
+                # 数据去加扰（在消息副本上原地进行；传输层可能延迟发送，副本不复用）
+                if offloaded and len(obfuscated_data) >= offloaded.threshold:
+                    data = await offloaded.deobfuscate(obfuscated_data)
+                else:
+                    data = obfuscator.deobfuscate_inplace(bytearray(obfuscated_data))
+                if clock:
+                    clock.lap(STAGE_DEOBFUSCATE)
                 
                 # 写入Shadowsocks
                 writer.write(data)
                 await writer.drain()
-                logger.debug(f'WSS->SS: {len(obfuscated_data)} bytes (deobfuscated to {len(data)} bytes)')
+                if clock:
+                    clock.lap(STAGE_DRAIN)
+                if trace and trace.sample():
+                    logger.debug('WSS->SS: %d bytes (deobfuscated to %d bytes)', len(obfuscated_data), len(data))
                 
         except Exception as e:
-            logger.debug(f'WSS->SS error: {e}')
+            if not isinstance(e, ConnectionClosedOK):  # 正常关闭不计为错误
+                self.metrics.count_error('relay', e)
+            logger.debug('WSS->SS error: %s', e)
         finally:
             running['active'] = False
             writer.close()
@@ -188,30 +484,190 @@ class WSSPluginServer:
     
     async def handle_ss_to_wss(self, websocket, reader: asyncio.StreamReader, running: dict):
         """处理从Shadowsocks到WSS客户端的数据流"""
+        obfuscator = self.get_obfuscator(websocket)
+        offloaded = self.offload.bind(obfuscator, self.obfs_key, websocket.subprotocol) if self.offload else None
+        sizer = self.create_read_sizer(obfuscator)
+        read_size = sizer.size
+        # 每个连接复用的加扰输出缓冲区，按读取上限分配（send 返回前帧已序列化，可安全复用）
+        tx_buffer = bytearray(obfuscator.max_frame_size(sizer.ceiling))
+        tx_view = memoryview(tx_buffer)
+        coalesce_max = min(self.coalesce_max, sizer.ceiling)
+        eof = False
         try:
+            if self.pipeline:
+                stats = await run_pipeline(
+                    stream_source(reader, sizer, self.coalesce_delay, coalesce_max),
+                    pipeline_obfuscator(obfuscator, offloaded),
+                    websocket.send,
+                    self.pipeline_buffer,
+                )
+                logger.debug('SS->WSS pipeline stats: %s', stats)
+                return
+            
+            clock = self.stage_timings.clock() if self.stage_timings else None  # 阶段计时（opt-in）
+            trace = frame_trace(logger, self.trace_every)  # 逐帧采样跟踪（仅 DEBUG）
             while running['active']:
                 # 从Shadowsocks读取数据
-                data = await reader.read(CFG_READ_BUF_SIZE)
+                if clock:
+                    clock.start()
+                data = await reader.read(read_size)
                 if not data:
                     logger.debug('Shadowsocks connection closed')
                     break
                 
+                # 写合并：短时间内的多次小读取合并为一帧发送
+                if self.coalesce_delay:
+                    data, eof = await coalesce_reads(reader, data, coalesce_max, self.coalesce_delay)
+                
+                if clock:
+                    clock.lap(STAGE_READ_WAIT)
+                
                 # 数据加扰
-                obfuscated_data = self.obfuscator.obfuscate(data)
+                if offloaded and len(data) >= offloaded.threshold:
+                    frame_len = await offloaded.obfuscate_into(data, tx_buffer)
+                else:
+                    frame_len = obfuscator.obfuscate_into(data, tx_buffer)
+                if clock:
+                    clock.lap(STAGE_OBFUSCATE)
                 
                 # 发送到WSS客户端
-                await websocket.send(obfuscated_data)
-                logger.debug(f'SS->WSS: {len(data)} bytes (obfuscated to {len(obfuscated_data)} bytes)')
+                await websocket.send(tx_view[:frame_len])
+                if clock:
+                    clock.lap(STAGE_WS_SEND)
+                if trace and trace.sample():
+                    logger.debug('SS->WSS: %d bytes (obfuscated to %d bytes, read_size=%d)', len(data), frame_len, read_size)
+                
+                # 根据本次读取量调整下一次的读取大小
+                read_size = sizer.update(len(data))
+                if eof:
+                    logger.debug('Shadowsocks connection closed')
+                    break
                 
         except Exception as e:
-            logger.debug(f'SS->WSS error: {e}')
+            if not isinstance(e, ConnectionClosedOK):  # 正常关闭不计为错误
+                self.metrics.count_error('relay', e)
+            logger.debug('SS->WSS error: %s', e)
         finally:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('SS->WSS read stats: %s', sizer.stats())
             running['active'] = False
     
+    async def handle_mux_stream(self, session: MuxSession, stream):
+        """处理复用会话上的新流：连接后端并转发（连接期间到达的数据在流中缓存）"""
+        ss_reader, ss_writer = await self.connect_to_shadowsocks()
+        sizer = AdaptiveReadSize(session.max_data, floor=self.read_buf_min, adaptive=self.adaptive_read)
+        await session.relay(stream, ss_reader, ss_writer, sizer, self.coalesce_delay, self.coalesce_max)
+    
+    async def handle_mux_client(self, websocket):
+        """处理复用WSS连接，每个流对应一个独立的后端连接"""
+        client_addr = websocket.remote_address
+        logger.info('New mux WSS client connection from %s', client_addr)
+        session = MuxSession(
+            websocket,
+            self.get_obfuscator(websocket),
+            self.get_obfuscator(websocket),
+            self.read_buf_size,
+            on_open=self.handle_mux_stream,
+        )
+        try:
+            await session.run()
+        finally:
+            await websocket.close()
+            logger.info('Mux WSS client connection closed %s', client_addr)
+    
+    async def run_stripe_group(self, flow_id: str, group: StripeGroup):
+        """等待同组通道到齐（期间并行连接后端），然后条带化转发该流"""
+        ss_writer = None
+        connect = asyncio.create_task(self.connect_to_shadowsocks())
+        try:
+            try:
+                await asyncio.wait_for(group.complete.wait(), CFG_STRIPE_GROUP_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f'only {sum(ws is not None for ws in group.websockets)}/{group.lanes} lanes arrived')
+            ss_reader, ss_writer = await connect
+            
+            flow = StripedFlow(
+                group.websockets,
+                [self.get_obfuscator(websocket) for websocket in group.websockets],
+                [self.get_obfuscator(websocket) for websocket in group.websockets],
+                self.read_buf_size,
+            )
+            sizer = AdaptiveReadSize(flow.max_data, floor=self.read_buf_min, adaptive=self.adaptive_read)
+            await flow.relay(ss_reader, ss_writer, sizer, self.coalesce_delay, self.coalesce_max)
+        except Exception as e:
+            self.metrics.count_error('stripe', e)
+            error_log.error('Error in striped flow %s: %s', flow_id, e)
+        finally:
+            self.stripe_groups.pop(flow_id, None)
+            if ss_writer:
+                ss_writer.close()
+            elif not connect.done():
+                connect.cancel()
+            group.finished.set_result(None)
+            if ss_writer is None:
+                # 通道未到齐（或被取消）时后端连接可能已经建立，需要关闭，避免泄漏
+                await self._discard_backend_connect(connect)
+    
+    @staticmethod
+    async def _discard_backend_connect(connect: asyncio.Task):
+        """等待已不再需要的后端连接任务结束，若已连上则关闭该连接"""
+        try:
+            _, writer = await connect
+        except (asyncio.CancelledError, Exception):
+            return
+        writer.close()
+    
+    async def cancel_stripe_groups(self):
+        """停止服务时取消仍在运行的条带化流，并等待其关闭后端连接"""
+        tasks = list(self.stripe_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def handle_stripe_lane(self, websocket, flow_id: str, lanes: int, lane: int):
+        """处理条带化流的一条通道：登记到流的分组，并保持连接直到该流结束"""
+        group = self.stripe_groups.get(flow_id)
+        if group is None:
+            group = self.stripe_groups[flow_id] = StripeGroup(lanes)
+            task = asyncio.create_task(self.run_stripe_group(flow_id, group))
+            self.stripe_tasks.add(task)
+            task.add_done_callback(self.stripe_tasks.discard)
+            logger.info('New striped flow %s from %s (%d lanes)', flow_id, websocket.remote_address, lanes)
+        elif group.lanes != lanes:
+            raise ValueError(f'Stripe lane count mismatch: {lanes} != {group.lanes}')
+        group.add(lane, websocket)
+        try:
+            await asyncio.shield(group.finished)
+        finally:
+            await websocket.close()
+    
     async def handle_client(self, websocket):
         """处理单个WSS客户端连接"""
+        if websocket.request.path.endswith(MUX_PATH_SUFFIX):
+            await self.handle_mux_client(websocket)
+            return
+        
+        try:
+            stripe = parse_stripe_path(websocket.request.path)
+        except ValueError as e:
+            error_log.error('Rejected WSS client %s: %s', websocket.remote_address, e)
+            await websocket.close()
+            return
+        if stripe and self.workers > 1:
+            # 各通道可能落到不同工作进程，永远无法到齐，直接拒绝而不是等待超时
+            error_log.error('Rejected striped flow from %s: stripe requires workers=1', websocket.remote_address)
+            await websocket.close()
+            return
+        if stripe:
+            try:
+                await self.handle_stripe_lane(websocket, *stripe)
+            except Exception as e:
+                self.metrics.count_error('stripe', e)
+                error_log.error('Error handling stripe lane: %s', e)
+            return
+        
         client_addr = websocket.remote_address
-        logger.info(f'New WSS client connection from {client_addr}')
+        logger.info('New WSS client connection from %s', client_addr)
         
         ss_reader = None
         ss_writer = None
@@ -241,16 +697,100 @@ class WSSPluginServer:
                     pass
             
         except Exception as e:
-            logger.error(f'Error handling WSS client: {e}')
+            self.metrics.count_error('client', e)
+            error_log.error('Error handling WSS client: %s', e)
         finally:
             if ss_writer:
                 ss_writer.close()
                 await ss_writer.wait_closed()
             await websocket.close()
-            logger.info(f'WSS client connection closed {client_addr}')
+            logger.info('WSS client connection closed %s', client_addr)
+    
+    async def start_metrics(self, endpoint: bool = True):
+        """按选项启动指标端点与阶段耗时摘要任务（endpoint 为 False 时只启动摘要任务，供 per-connection 模式使用）"""
+        if self.stage_timings is not None:
+            # 阶段计时只覆盖普通转发循环，流水线模式下直方图会一直为空；mux 与条带化连接同样不计时
+            if self.pipeline:
+                logger.warning('stage_timing does not cover pipeline mode; relayed connections are not timed')
+            self.stage_reporter = asyncio.create_task(
+                report_stage_timings(self.stage_timings, self.stage_report, logger))
+        if endpoint and self.metrics_address:
+            self.metrics_server = await start_metrics_server(self.metrics, (
+                self.metrics_address if self.worker_index is None
+                else worker_address(self.metrics_address, self.worker_index)))
+    
+    async def stop_metrics(self):
+        """关闭指标端点与阶段耗时摘要任务"""
+        if self.stage_reporter is not None:
+            self.stage_reporter.cancel()
+            try:
+                await self.stage_reporter
+            except asyncio.CancelledError:
+                pass
+            self.stage_reporter = None
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            await self.metrics_server.wait_closed()
+            self.metrics_server = None
+    
+    def _collect_metrics(self) -> list:
+        """抓取时读取连接与后端连接池的状态"""
+        samples = [
+            ('connections_active', 'gauge', 'Active WebSocket connections', self.connections_active, {}),
+            ('connections_total', 'counter', 'Accepted WebSocket connections', self.connections_total, {}),
+            ('stripe_groups_pending', 'gauge', 'Striped flows waiting for lanes', len(self.stripe_groups), {}),
+        ]
+        if self.backend_pool is not None:
+            labels = {'pool': self.backend_pool.name}
+            samples += [
+                ('pool_idle', 'gauge', 'Idle pre-connected connections', self.backend_pool.idle, labels),
+                ('pool_hits_total', 'counter', 'Pool acquisitions served from idle connections',
+                 self.backend_pool.hits, labels),
+                ('pool_misses_total', 'counter', 'Pool acquisitions that had to connect',
+                 self.backend_pool.misses, labels),
+            ]
+        return samples
+    
+    def attach_worker_stats(self, index: int, stats):
+        """工作进程：将连接统计写入监督进程可读的共享数组"""
+        self.worker_index = index
+        self.worker_stats = stats
+        self._publish_stats()
+    
+    def _publish_stats(self):
+        """同步连接统计到共享数组"""
+        if self.worker_stats is not None:
+            base = self.worker_index * len(WORKER_STAT_FIELDS)
+            self.worker_stats[base] = self.connections_total
+            self.worker_stats[base + 1] = self.connections_active
+    
+    async def handle_connection(self, websocket):
+        """serve 的连接处理入口：统计连接数后交给 handle_client"""
+        self.connections_total += 1
+        self.connections_active += 1
+        self._publish_stats()
+        self.observe_handshake(websocket)
+        self.tune_socket(websocket.transport.get_extra_info('socket'))
+        try:
+            await self.handle_client(websocket)
+        finally:
+            self.connections_active -= 1
+            self._publish_stats()
+    
+    def observe_handshake(self, websocket):
+        """记录从接受 TCP 连接到进入处理函数的握手耗时（按 TLS 完整/恢复区分）"""
+        accepted_at = getattr(websocket, 'accepted_at', None)
+        if accepted_at is None:
+            return
+        tls = 'none'
+        ssl_object = websocket.transport.get_extra_info('ssl_object')
+        if ssl_object is not None:
+            tls = 'resumed' if ssl_object.session_reused else 'full'
+        self.metrics.histogram('websocket_handshake_seconds', 'Server-side TLS and WebSocket handshake duration',
+                               tls=tls).observe(time.perf_counter() - accepted_at)
     
-    async def start(self):
-        """启动服务端"""
+    async def start(self, reuse_port: bool = False):
+        """启动服务端（reuse_port 为 True 时以 SO_REUSEPORT 绑定，供多个工作进程共享端口）"""
         ssl_context = None
         protocol = 'wss'
         
@@ -262,24 +802,175 @@ class WSSPluginServer:
             protocol = 'ws'
         
         async with serve(
-            self.handle_client,
+            self.handle_connection,
             self.wss_host,
             self.wss_port,
             ssl=ssl_context,
+            select_subprotocol=lambda connection, subprotocols: self._select_subprotocol(connection, subprotocols),
             max_size=CFG_MAX_MESSAGE_SIZE,
             ping_interval=CFG_PING_INTERVAL,
-            ping_timeout=CFG_PING_TIMEOUT
+            ping_timeout=CFG_PING_TIMEOUT,
+            reuse_port=reuse_port or None,
+            backlog=CFG_LISTEN_BACKLOG,
+            create_connection=TimedServerConnection
         ) as server:
             logger.info(f'Plugin Server listening on {protocol}://{self.wss_host}:{self.wss_port}{self.wss_path}')
-            await asyncio.Future()  # run forever
+            self.start_backend_pool()
+            await self.start_metrics()
+            try:
+                await wait_for_shutdown()
+                logger.info('Received shutdown signal, stopping server...')
+            finally:
+                await self.cancel_stripe_groups()
+                await self.stop_metrics()
+                await self.close_backend_pool()
+                if self.offload:
+                    # 进程池卸载的子进程不关闭时，工作进程退出时会一直等待它们
+                    self.offload.shutdown()
+
+
+async def _watch_parent(parent_pid: int):
+    """工作进程：监督进程退出（被 SIGKILL 等）后自行退出，避免遗留孤儿进程"""
+    while os.getppid() == parent_pid:
+        await asyncio.sleep(1)
+    logger.warning('Supervisor exited, worker shutting down')
+
+
+async def worker_async_main(server, parent_pid: int):
+    """工作进程的事件循环：运行服务端直到监督进程退出"""
+    server.log_event_loop()
+    serving = asyncio.create_task(server.start(reuse_port=True))
+    watcher = asyncio.create_task(_watch_parent(parent_pid))
+    done, pending = await asyncio.wait([serving, watcher], return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        task.result()
+
+
+def worker_main(index: int, stats, parent_pid: int):
+    """工作进程入口（spawn 启动，从继承的环境变量重新读取配置）"""
+    try:
+        # 阶段耗时摘要任务安装 SIGUSR1 处理前，忽略监督进程转发的信号（默认动作会结束进程）
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+        server = WSSPluginServer()
+        server.attach_worker_stats(index, stats)
+        logger.info(f'Worker {index} started (pid {os.getpid()})')
+        if server.use_uvloop:
+            install_uvloop()
+        asyncio.run(worker_async_main(server, parent_pid))
+    except KeyboardInterrupt:
+        pass
+
+
+async def run_workers(server):
+    """
+    监督进程：启动 server.workers 个工作进程，异常退出时按退避重启，并定期汇总统计
+    
+    工作进程各自运行事件循环并以 SO_REUSEPORT 绑定监听端口，由内核在进程间分配新连接。
+    """
+    loop = asyncio.get_running_loop()
+    ctx = multiprocessing.get_context('spawn')
+    fields = len(WORKER_STAT_FIELDS)
+    stats = ctx.Array('q', server.workers * fields, lock=False)
+    retired_total = 0  # 已退出工作进程的累计连接数
+    restarts = 0
+    
+    processes = [None] * server.workers
+    started = [0.0] * server.workers
+    restart_at = [None] * server.workers
+    backoff = [CFG_WORKER_RESTART_MIN] * server.workers
+    
+    def launch(index):
+        process = ctx.Process(
+            target=worker_main,
+            args=(index, stats, os.getpid()),
+            name=f'wss-plugin-worker-{index}',
+            # 非守护进程：守护进程不能再创建子进程（进程池卸载需要），退出时由下方 finally 显式结束
+            daemon=False,
+        )
+        process.start()
+        processes[index] = process
+        started[index] = loop.time()
+        restart_at[index] = None
+    
+    def forward_dump_signal():
+        """SIGUSR1：转发给各工作进程，由其输出阶段耗时累计摘要"""
+        if server.stage_timings is None:
+            return
+        for process in processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signal.SIGUSR1)
+    
+    # 监督进程不做阶段计时；未处理时 SIGUSR1 的默认动作会结束监督进程
+    dump_signal = getattr(signal, 'SIGUSR1', None)
+    if dump_signal is not None:
+        try:
+            loop.add_signal_handler(dump_signal, forward_dump_signal)
+        except (NotImplementedError, RuntimeError, ValueError):
+            dump_signal = None
+    
+    logger.info(f'Starting {server.workers} worker processes')
+    for index in range(server.workers):
+        launch(index)
+    
+    last_report = loop.time()
+    try:
+        while True:
+            await asyncio.sleep(1)
+            now = loop.time()
+            
+            for index, process in enumerate(processes):
+                if restart_at[index] is not None:
+                    if now >= restart_at[index]:
+                        restarts += 1
+                        launch(index)
+                    continue
+                if process.is_alive():
+                    continue
+                
+                # 工作进程退出：累计其连接数，按运行时长决定重启退避
+                base = index * fields
+                retired_total += stats[base]
+                stats[base] = stats[base + 1] = 0
+                if now - started[index] < CFG_WORKER_MIN_UPTIME:
+                    backoff[index] = min(backoff[index] * 2, CFG_WORKER_RESTART_MAX)
+                else:
+                    backoff[index] = CFG_WORKER_RESTART_MIN
+                restart_at[index] = now + backoff[index]
+                logger.warning(f'Worker {index} (pid {process.pid}) exited with code {process.exitcode}, '
+                               f'restarting in {backoff[index]}s')
+            
+            if now - last_report >= CFG_WORKER_STATS_INTERVAL:
+                last_report = now
+                alive = sum(1 for process in processes if process.is_alive())
+                total = retired_total + sum(stats[index * fields] for index in range(server.workers))
+                active = sum(stats[index * fields + 1] for index in range(server.workers))
+                logger.info(f'Workers: {alive}/{server.workers} alive, restarts={restarts}, '
+                           f'connections active={active}, total={total}')
+    finally:
+        if dump_signal is not None:
+            loop.remove_signal_handler(dump_signal)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            await loop.run_in_executor(None, process.join)
 
 
 async def main():
     """主函数 - 支持 per-connection 和 daemon 两种模式"""
     try:
         server = WSSPluginServer()
+        server.log_event_loop()
         
-        if CFG_PRE_CONNECTION:
+        if server.workers > 1:
+            # 多进程模式：监督进程只负责启动和重启工作进程
+            logger.info(f'Running in multi-process mode ({server.workers} workers)')
+            logger.warning('Striped clients (stripe=K) are rejected in multi-process mode; use workers=1 for striping')
+            await run_workers(server)
+        elif server.mode == 'per-connection':
             # Per-connection mode：处理单个客户端连接后退出
             logger.info('Running in per-connection mode')
             await main_per_connection(server)
@@ -313,7 +1004,7 @@ async def main_per_connection(server):
         
         # 监听一个连接（使用 serve 但立即接受一个连接后就处理）
         async def handle_one_connection(websocket):
-            logger.info(f'Per-connection: Handling WebSocket client from {websocket.remote_address}')
+            logger.info('Per-connection: Handling WebSocket client from %s', websocket.remote_address)
             await server.handle_client(websocket)
         
         # 创建服务器以接受单个连接
@@ -322,6 +1013,7 @@ async def main_per_connection(server):
             server.wss_host,
             server.wss_port,
             ssl=ssl_context,
+            select_subprotocol=lambda connection, subprotocols: server._select_subprotocol(connection, subprotocols),
             max_size=CFG_MAX_MESSAGE_SIZE,
             ping_interval=CFG_PING_INTERVAL,
             ping_timeout=CFG_PING_TIMEOUT
@@ -330,11 +1022,27 @@ async def main_per_connection(server):
             
             # 在 per-connection mode 下，我们通常只处理一个连接
             # 但保持服务器运行，让 ss-libev 控制生命周期
-            await asyncio.Future()  # run forever
+            server.start_backend_pool()
+            await server.start_metrics(endpoint=False)
+            try:
+                await asyncio.Future()  # run forever
+            finally:
+                await server.cancel_stripe_groups()
+                await server.stop_metrics()
+                await server.close_backend_pool()
             
     except Exception as e:
         logger.error(f'Error in per-connection mode: {e}', exc_info=True)
 
 
-if __name__ == '__main__':
+def run():
+    """命令行入口：按插件选项选择事件循环后运行 main()"""
+    plugin_opts = WSSPluginServer._parse_plugin_opts(os.environ.get('SS_PLUGIN_OPTIONS', ''))
+    if plugin_opts.get('uvloop', 'false').lower() in ('true', '1', 'yes'):
+        install_uvloop()
     asyncio.run(main())
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()  # PyInstaller 打包后的 spawn 工作进程
+    run()